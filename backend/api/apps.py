@@ -1,5 +1,50 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from recipes.models import (Ingredient, IngredientAmount, Recipe,
+                                    Tag, release_recipe_from_carts)
+        from rest_framework.authtoken.models import Token
+
+        from .authentication import invalidate_token, invalidate_user_tokens
+        from .caching import reset_catalogue_cache
+        from .cookable import cookable_recipe_changed
+        from .recipe_cache import (invalidate_author, invalidate_recipe,
+                                   invalidate_recipe_amounts,
+                                   invalidate_recipe_tags)
+        from .search import (ingredient_changed, recipe_amounts_changed,
+                             recipe_saved, recipe_tags_changed, tag_changed)
+
+        for model in (Ingredient, Tag):
+            post_save.connect(reset_catalogue_cache, sender=model)
+            post_delete.connect(reset_catalogue_cache, sender=model)
+
+        post_save.connect(invalidate_recipe, sender=Recipe)
+        post_delete.connect(invalidate_recipe, sender=Recipe)
+        pre_delete.connect(release_recipe_from_carts, sender=Recipe)
+        post_save.connect(invalidate_recipe_amounts, sender=IngredientAmount)
+        post_delete.connect(invalidate_recipe_amounts,
+                            sender=IngredientAmount)
+        m2m_changed.connect(invalidate_recipe_tags,
+                            sender=Recipe.tags.through)
+        post_save.connect(invalidate_author, sender=get_user_model())
+
+        post_save.connect(invalidate_user_tokens, sender=get_user_model())
+        post_delete.connect(invalidate_token, sender=Token)
+
+        post_save.connect(recipe_saved, sender=Recipe)
+        post_save.connect(recipe_amounts_changed, sender=IngredientAmount)
+        post_delete.connect(recipe_amounts_changed, sender=IngredientAmount)
+        post_save.connect(cookable_recipe_changed, sender=IngredientAmount)
+        post_delete.connect(cookable_recipe_changed, sender=IngredientAmount)
+        m2m_changed.connect(recipe_tags_changed, sender=Recipe.tags.through)
+        for handler, model in ((tag_changed, Tag),
+                               (ingredient_changed, Ingredient)):
+            post_save.connect(handler, sender=model)
+            pre_delete.connect(handler, sender=model)
@@ -0,0 +1,137 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import router, transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+TOKEN_CACHE_KEY = 'auth-token:{}'
+
+
+def get_shared_timeout():
+    # Кэш в памяти процесса общим не является: сброс в одном процессе не
+    # дошёл бы до копий в других, и токен жил бы в них до конца таймаута.
+    if isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache):
+        return 0
+    return settings.TOKEN_AUTH_SHARED_CACHE_TIMEOUT
+
+
+def take_snapshot(user):
+    # Хеш пароля в кэш не попадает: поле остаётся отложенным и
+    # загружается из базы, только когда нужно, например при смене пароля.
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields
+        if field.attname != 'password'
+    }
+
+
+def restore_user(snapshot):
+    User = get_user_model()
+    fields = [field.attname for field in User._meta.concrete_fields
+              if field.attname in snapshot]
+    return User.from_db(router.db_for_read(User), fields,
+                        [snapshot[field] for field in fields])
+
+
+class TokenCache:
+    """Снимки пользователей по токенам.
+
+    Снимок хранится в LRU в памяти процесса TOKEN_AUTH_CACHE_TIMEOUT
+    секунд и в общем кэше TOKEN_AUTH_SHARED_CACHE_TIMEOUT секунд; при
+    LocMemCache общий слой отключён. Сброс удаляет запись из памяти
+    этого процесса и из общего кэша, поэтому другие процессы узнают о
+    выходе пользователя не позже чем через TOKEN_AUTH_CACHE_TIMEOUT
+    секунд. Снимки пишутся только для активных пользователей; изменения
+    в обход сигналов, например queryset.update(), видны после истечения
+    снимка, то есть до TOKEN_AUTH_SHARED_CACHE_TIMEOUT секунд.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get_shared_key(self, key):
+        # Сам токен в общий кэш не пишется.
+        return TOKEN_CACHE_KEY.format(
+            hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(key)
+                    return entry[1]
+                del self.entries[key]
+        if not get_shared_timeout():
+            return None
+        snapshot = cache.get(self.get_shared_key(key))
+        if snapshot is not None:
+            self.store(key, snapshot)
+        return snapshot
+
+    def store(self, key, snapshot):
+        expires = time.monotonic() + settings.TOKEN_AUTH_CACHE_TIMEOUT
+        with self.lock:
+            self.entries[key] = (expires, snapshot)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.TOKEN_AUTH_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def set(self, key, snapshot):
+        self.store(key, snapshot)
+        timeout = get_shared_timeout()
+        if timeout:
+            cache.set(self.get_shared_key(key), snapshot, timeout)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        if get_shared_timeout():
+            cache.delete_many([self.get_shared_key(key) for key in keys])
+
+
+token_cache = TokenCache()
+
+
+class CachingTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену без запроса к базе для известных токенов.
+
+    Пользователь собирается из снимка заново для каждого запроса, поэтому
+    изменения request.user не попадают в кэш.
+    """
+
+    def authenticate_credentials(self, key):
+        snapshot = token_cache.get(key)
+        if snapshot is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, take_snapshot(user))
+            return user, token
+        user = restore_user(snapshot)
+        return user, self.get_model()(key=key, user=user)
+
+
+def invalidate_token(sender, instance, **kwargs):
+    key = instance.key
+    transaction.on_commit(lambda: token_cache.delete_many([key]))
+
+
+def invalidate_user_tokens(sender, instance, created, update_fields=None,
+                           **kwargs):
+    # Время последнего входа обновляется при каждом входе, а на
+    # аутентификацию не влияет.
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    keys = list(Token.objects.filter(user_id=instance.pk)
+                .values_list('key', flat=True))
+    if keys:
+        transaction.on_commit(lambda: token_cache.delete_many(keys))
@@ -0,0 +1,49 @@
+from bisect import bisect_left
+
+from django.conf import settings
+from recipes.models import Ingredient
+
+from .caching import CatalogueSnapshot
+
+
+class IngredientIndex(CatalogueSnapshot):
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Хранит отсортированный массив названий в нижнем регистре: совпадения
+    по началу названия ищутся бинарным поиском, по вхождению - проходом
+    по массиву.
+    """
+    model = Ingredient
+
+    def build(self):
+        items = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: (item['name'].lower(), item['id']),
+        )
+        keys = [item['name'].lower() for item in items]
+        return keys, items
+
+    def all(self):
+        return self.get_data()[1]
+
+    def search(self, query, limit=None):
+        keys, items = self.get_data()
+        query = query.strip().lower()
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        start = end = bisect_left(keys, query)
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        # Точное совпадение сортируется первым среди совпадений по началу.
+        result = items[start:min(end, start + limit)]
+        if len(result) < limit:
+            for position, key in enumerate(keys):
+                if start <= position < end or query not in key:
+                    continue
+                result.append(items[position])
+                if len(result) >= limit:
+                    break
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+CATALOGUE_STATE_KEY = 'catalogue-state:{}'
+SHARED_CACHE_ALIAS = 'shared'
+
+
+def get_shared_cache():
+    """Кэш, общий для всех процессов: только версии и номера изменений."""
+    return caches[SHARED_CACHE_ALIAS]
+
+
+def get_catalogue_state(model):
+    shared_cache = get_shared_cache()
+    key = CATALOGUE_STATE_KEY.format(model._meta.label_lower)
+    state = shared_cache.get(key)
+    if state is None:
+        shared_cache.add(key, {'version': uuid4().hex,
+                               'last_modified': int(time.time())}, None)
+        state = shared_cache.get(key)
+    return state
+
+
+def bump_catalogue_version(model):
+    get_shared_cache().set(
+        CATALOGUE_STATE_KEY.format(model._meta.label_lower),
+        {'version': uuid4().hex, 'last_modified': int(time.time())}, None)
+
+
+def reset_catalogue_cache(sender, **kwargs):
+    bump_catalogue_version(sender)
+
+
+class CatalogueSnapshot:
+    """Данные справочника в памяти процесса.
+
+    Снимок перестраивается при первом обращении после того, как версия
+    справочника в кэше сменилась.
+    """
+    model = None
+
+    def __init__(self):
+        self._data = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def get_data(self):
+        version = get_catalogue_state(self.model)['version']
+        data = self._data
+        if data is None or data[0] != version:
+            data = (version, self.build())
+            self._data = data
+        return data[1]
+
+    def bump_version(self):
+        bump_catalogue_version(self.model)
+        self._data = None
+
+
+class CatalogueCacheMixin:
+    """Кэширует ответы справочников, которые почти не меняются.
+
+    Ключ кэша включает версию справочника, которую сигналы post_save и
+    post_delete заменяют на новую. По этой же версии отдаются ETag и
+    Last-Modified, так что клиенты и nginx получают 304.
+
+    В кэш попадают только ответы без параметров запроса. Ответы с
+    параметрами (подсказки по ?name=) строятся заново, а ETag для них
+    считается по версии справочника и адресу запроса.
+    """
+
+    def cached_response(self, request, build):
+        model = self.get_queryset().model
+        state = get_catalogue_state(model)
+        if request.query_params:
+            etag = quote_etag(hashlib.sha1('{}:{}'.format(
+                state['version'], request.get_full_path(),
+            ).encode()).hexdigest())
+            not_modified = get_conditional_response(
+                request, etag=etag, last_modified=state['last_modified'])
+            if not_modified is not None:
+                return self.finalize_catalogue_response(
+                    not_modified, etag, state)
+            response = build()
+            if response.status_code != 200:
+                return response
+            return self.finalize_catalogue_response(
+                Response(response.data), etag, state)
+
+        key = 'catalogue:{}:{}:{}'.format(
+            model._meta.label_lower, state['version'], request.path)
+        cached = cache.get(key)
+        if cached is None:
+            response = build()
+            if response.status_code != 200:
+                return response
+            etag = quote_etag(hashlib.sha1(json.dumps(
+                response.data, ensure_ascii=False, sort_keys=True,
+            ).encode()).hexdigest())
+            cached = (response.data, etag)
+            cache.set(key, cached, settings.CATALOGUE_CACHE_TIMEOUT)
+        data, etag = cached
+        return get_conditional_response(
+            request, etag=etag, last_modified=state['last_modified'],
+            response=self.finalize_catalogue_response(
+                Response(data), etag, state))
+
+    def finalize_catalogue_response(self, response, etag, state):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(state['last_modified'])
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CatalogueCacheMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CatalogueCacheMixin, self).retrieve(
+                request, *args, **kwargs))
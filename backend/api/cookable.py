@@ -0,0 +1,176 @@
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from recipes.models import IngredientAmount
+
+from .caching import (bump_catalogue_version, get_catalogue_state,
+                      get_shared_cache)
+
+COOKABLE_SEQUENCE_KEY = 'cookable:sequence'
+COOKABLE_CHANGE_KEY = 'cookable:change:{}'
+
+IndexData = namedtuple(
+    'IndexData', ('version', 'sequence', 'postings', 'ingredients'))
+
+_pending = threading.local()
+
+
+def get_pending():
+    if not hasattr(_pending, 'recipe_ids'):
+        _pending.recipe_ids = set()
+    return _pending.recipe_ids
+
+
+class CookableIndex:
+    """Обратный индекс «ингредиент -> рецепты» для подбора по продуктам.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта - его ингредиенты. Покрытие рецепта считается
+    пересечением массивов выбранных ингредиентов.
+
+    Изменения рецептов публикуются в общем кэше под растущими номерами,
+    и процесс применяет к индексу только их. Полностью индекс строится
+    при первом обращении, при смене версии IngredientAmount и когда
+    процесс отстал больше чем на COOKABLE_INDEX_MAX_CHANGES изменений.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._data = None
+
+    def get_state(self):
+        shared_cache = get_shared_cache()
+        sequence = shared_cache.get(COOKABLE_SEQUENCE_KEY)
+        if sequence is None:
+            # Номера начинаются со времени, чтобы после вытеснения ключа
+            # не повторить номер, до которого процесс уже дошёл.
+            shared_cache.add(COOKABLE_SEQUENCE_KEY,
+                             int(time.time() * 1000), None)
+            sequence = shared_cache.get(COOKABLE_SEQUENCE_KEY)
+        return get_catalogue_state(IngredientAmount)['version'], sequence
+
+    def get_data(self):
+        version, sequence = self.get_state()
+        data = self._data
+        if data is not None and (data.version, data.sequence) == (
+                version, sequence):
+            return data
+        # Пока один поток обновляет индекс, остальные ждут его, а не
+        # строят свои копии.
+        with self.lock:
+            data = self._data
+            if data is not None and (data.version, data.sequence) == (
+                    version, sequence):
+                return data
+            updated = None
+            if data is not None and data.version == version:
+                updated = self.apply_changes(data, sequence)
+            if updated is None:
+                updated = self.build(version, sequence)
+            self._data = updated
+        return updated
+
+    def build(self, version, sequence):
+        postings = {}
+        ingredients = defaultdict(list)
+        rows = (
+            IngredientAmount.objects
+            .values_list('ingredient_id', 'recipe_id')
+            .order_by('ingredient_id', 'recipe_id')
+        )
+        for ingredient_id, recipe_id in rows.iterator():
+            if ingredient_id not in postings:
+                postings[ingredient_id] = array('I')
+            postings[ingredient_id].append(recipe_id)
+            ingredients[recipe_id].append(ingredient_id)
+        return IndexData(version, sequence, postings, {
+            recipe_id: tuple(ids) for recipe_id, ids in ingredients.items()
+        })
+
+    def apply_changes(self, data, sequence):
+        # Индекс не меняется на месте: запросы в других потоках читают
+        # старую копию, пока новая не готова.
+        missed = sequence - data.sequence
+        if not 0 < missed <= settings.COOKABLE_INDEX_MAX_CHANGES:
+            return None
+        keys = [COOKABLE_CHANGE_KEY.format(number)
+                for number in range(data.sequence + 1, sequence + 1)]
+        changes = get_shared_cache().get_many(keys)
+        if len(changes) != len(keys):
+            return None
+        recipe_ids = set().union(*changes.values())
+
+        ingredients = dict(data.ingredients)
+        added = defaultdict(list)
+        affected = set()
+        for recipe_id in recipe_ids:
+            affected.update(ingredients.pop(recipe_id, ()))
+        rows = (
+            IngredientAmount.objects
+            .filter(recipe_id__in=recipe_ids)
+            .values_list('recipe_id', 'ingredient_id')
+        )
+        for recipe_id, ingredient_id in rows:
+            ingredients[recipe_id] = (
+                ingredients.get(recipe_id, ()) + (ingredient_id,))
+            added[ingredient_id].append(recipe_id)
+            affected.add(ingredient_id)
+
+        postings = dict(data.postings)
+        for ingredient_id in affected:
+            posting = [
+                recipe_id for recipe_id in postings.get(ingredient_id, ())
+                if recipe_id not in recipe_ids
+            ]
+            posting.extend(added[ingredient_id])
+            if posting:
+                postings[ingredient_id] = array('I', sorted(posting))
+            else:
+                postings.pop(ingredient_id, None)
+        return IndexData(data.version, sequence, postings, ingredients)
+
+    def publish(self):
+        recipe_ids = get_pending()
+        if not recipe_ids:
+            return
+        _pending.recipe_ids = set()
+        self.get_state()
+        shared_cache = get_shared_cache()
+        sequence = shared_cache.incr(COOKABLE_SEQUENCE_KEY)
+        # incr не везде атомарен: если номер уже занят, изменение другого
+        # процесса было бы потеряно, поэтому индекс перестраивается целиком.
+        if not shared_cache.add(COOKABLE_CHANGE_KEY.format(sequence),
+                                recipe_ids, settings.CATALOGUE_CACHE_TIMEOUT):
+            bump_catalogue_version(IngredientAmount)
+
+    def recipes_changed(self, recipe_ids):
+        """Отмечает рецепты, ингредиенты которых изменились.
+
+        Изменения одной транзакции публикуются вместе после коммита.
+        """
+        get_pending().update(recipe_ids)
+        transaction.on_commit(self.publish)
+
+    def rank(self, ingredient_ids, min_coverage=0, limit=None):
+        data = self.get_data()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(data.postings.get(ingredient_id, ()))
+        ranked = []
+        for recipe_id, count in matched.items():
+            coverage = count / len(data.ingredients[recipe_id])
+            if coverage >= min_coverage:
+                ranked.append((recipe_id, coverage, count))
+        ranked.sort(key=lambda item: (-item[1], -item[2], -item[0]))
+        return ranked[:limit]
+
+
+cookable_index = CookableIndex()
+
+
+def cookable_recipe_changed(sender, instance, **kwargs):
+    cookable_index.recipes_changed([instance.recipe_id])
@@ -0,0 +1,132 @@
+import csv
+import io
+import json
+import os
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+SHOPPING_LIST_TITLE = 'Cписок покупок:'
+SHOPPING_LIST_FILENAME = 'list-to-buy'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class BaseExporter(BaseRenderer):
+    """Формат выгрузки списка покупок.
+
+    Экспортеры подключаются к action как renderer_classes, поэтому формат
+    выбирается штатным согласованием DRF: по параметру ?format= или по
+    заголовку Accept. Ответ с ошибкой отдаётся как JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+    def get_response(self, rows):
+        content_type = self.media_type
+        if self.charset:
+            content_type = f'{content_type}; charset={self.charset}'
+        response = StreamingHttpResponse(
+            self.stream(rows), content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename={SHOPPING_LIST_FILENAME}.{self.format}')
+        return response
+
+
+class TextExporter(BaseExporter):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        yield SHOPPING_LIST_TITLE
+        for row in rows:
+            yield '\n{} - {} {}.'.format(*row)
+
+
+class CsvExporter(BaseExporter):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('Ингредиент', 'Количество', 'Ед. измерения'))
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class JsonExporter(BaseExporter):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, rows):
+        separator = ''
+        yield '['
+        for name, amount, measurement_unit in rows:
+            yield separator + json.dumps({
+                'name': name,
+                'amount': amount,
+                'measurement_unit': measurement_unit,
+            }, ensure_ascii=False)
+            separator = ','
+        yield ']'
+
+
+class PdfExporter(BaseExporter):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+
+    def get_font(self):
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        if self.font_name in pdfmetrics.getRegisteredFontNames():
+            return self.font_name
+        font_path = settings.SHOPPING_LIST_PDF_FONT
+        if not os.path.exists(font_path):
+            return 'Helvetica'
+        pdfmetrics.registerFont(TTFont(self.font_name, font_path))
+        return self.font_name
+
+    def stream(self, rows):
+        # reportlab собирает документ целиком, поэтому PDF отдаётся
+        # одним куском после того, как все строки прочитаны из курсора.
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        buffer = io.BytesIO()
+        font = self.get_font()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        top = height - 50
+        pdf.setFont(font, 16)
+        pdf.drawString(50, top, SHOPPING_LIST_TITLE)
+        pdf.setFont(font, 12)
+        y = top - 30
+        for row in rows:
+            if y < 50:
+                pdf.showPage()
+                pdf.setFont(font, 12)
+                y = top
+            pdf.drawString(50, y, '{} - {} {}.'.format(*row))
+            y -= 20
+        pdf.save()
+        yield buffer.getvalue()
+
+
+SHOPPING_LIST_EXPORTERS = (
+    TextExporter,
+    CsvExporter,
+    JsonExporter,
+    PdfExporter,
+)
@@ -0,0 +1,92 @@
+import base64
+import binascii
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image
+from recipes.images import get_variant_urls
+from rest_framework import serializers
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    """Картинка в Base64, которая декодируется по частям.
+
+    Декодированные данные пишутся во временный файл, который держится в
+    памяти только до RECIPE_IMAGE_SPOOL_SIZE байт. Pillow проверяет
+    заголовок и структуру файла, не распаковывая пиксели.
+    """
+    CHUNK_SIZE = 64 * 1024
+    FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+    default_error_messages = {
+        'invalid_base64': 'Ожидается картинка в кодировке Base64.',
+        'invalid_image': 'Загрузите корректную картинку.',
+        'too_large': 'Картинка больше допустимого размера.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid_base64')
+        if data.startswith('data:'):
+            data = data.partition(',')[2]
+        data = data.strip()
+        if not data:
+            self.fail('invalid_base64')
+        if len(data) // 4 * 3 > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('too_large')
+
+        file = SpooledTemporaryFile(
+            max_size=settings.RECIPE_IMAGE_SPOOL_SIZE)
+        try:
+            self.decode(data, file)
+            extension = self.validate_image(file)
+        except serializers.ValidationError:
+            file.close()
+            raise
+        file.seek(0)
+        # Имя файла по содержимому выбирает хранилище рецептов.
+        return File(file, name='image.{}'.format(extension))
+
+    def decode(self, data, file):
+        try:
+            for start in range(0, len(data), self.CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    data[start:start + self.CHUNK_SIZE], validate=True))
+        except (binascii.Error, ValueError):
+            self.fail('invalid_base64')
+
+    def validate_image(self, file):
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                image_format = image.format
+                width, height = image.size
+                image.verify()
+        except (Image.DecompressionBombError, OSError, SyntaxError,
+                ValueError):
+            self.fail('invalid_image')
+        if image_format not in self.FORMATS:
+            self.fail('invalid_image')
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail('too_large')
+        return self.FORMATS[image_format]
+
+
+class ImageVariantsField(serializers.Field):
+    """Ссылки на уменьшенные копии картинки рецепта по размерам."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        urls = get_variant_urls(recipe)
+        request = self.context.get('request')
+        if urls is None or request is None:
+            return urls
+        return {
+            variant: request.build_absolute_uri(url)
+            for variant, url in urls.items()
+        }
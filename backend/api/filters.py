@@ -1,9 +1,30 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Recipe, Ingredient
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from rest_framework.filters import SearchFilter
+
+from .caching import CatalogueSnapshot
+from .search import get_search_backend
 
 User = get_user_model()
 
+POPULAR_ORDERING = ('-favorites_count', '-pub_date', '-id')
+
+
+class TagSlugMap(CatalogueSnapshot):
+    model = Tag
+
+    def build(self):
+        return dict(Tag.objects.values_list('slug', 'id'))
+
+    def get_choices(self):
+        return [(slug, slug) for slug in self.get_data()]
+
+
+tag_slug_map = TagSlugMap()
+
 
 class IngredientFilter(FilterSet):
     name = filters.CharFilter(lookup_expr='istartswith')
@@ -14,8 +35,9 @@ class IngredientFilter(FilterSet):
 
 
 class RecipesFilter(FilterSet):
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug'
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_slug_map.get_choices,
+        method='filter_tags',
         )
     
     author = filters.ModelChoiceFilter(
@@ -30,17 +52,51 @@ class RecipesFilter(FilterSet):
         method='filter_is_in_shopping_cart',
         )
 
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'popular'),),
+        method='filter_ordering',
+        )
+
     class Meta:
         model = Recipe
-        fields = ['is_favorited', 'author', 'tags', 'is_in_shopping_cart']
+        fields = ['is_favorited', 'author', 'tags', 'is_in_shopping_cart',
+                  'ordering']
+
+    def filter_tags(self, queryset, name, value):
+        slugs = tag_slug_map.get_data()
+        tag_ids = [slugs[slug] for slug in value if slug in slugs]
+        if not tag_ids:
+            return queryset
+        return queryset.annotate(
+            has_tags=Exists(Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag_id__in=tag_ids)),
+        ).filter(has_tags=True)
 
     def filter_is_favorited(self, queryset, name, value):
-        if value and not self.request.user.is_anonymous:
-            return queryset.filter(favorite_recipe__user=self.request.user)
+        user = self.request.user
+        if value and not user.is_anonymous:
+            return queryset.annotate(
+                in_favorites=Exists(FavoriteRecipe.objects.filter(
+                    user=user, favorite_recipe=OuterRef('pk'))),
+            ).filter(in_favorites=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        if value and not self.request.user.is_anonymous:
-            return queryset.filter(
-                recipe_shopping_cart__user=self.request.user)
-        return queryset
\ No newline at end of file
+        user = self.request.user
+        if value and not user.is_anonymous:
+            return queryset.annotate(
+                in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+            ).filter(in_shopping_cart=True)
+        return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*POPULAR_ORDERING)
+
+
+class RecipeSearchFilter(SearchFilter):
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return get_search_backend().search(queryset, query)
@@ -0,0 +1,250 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+METRICS = {
+    'total': ('request_duration_seconds',
+              'Время обработки запроса',
+              (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)),
+    'db': ('db_duration_seconds',
+           'Время SQL-запросов за запрос',
+           (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)),
+    'serialization': ('serialization_duration_seconds',
+                      'Время представления вне базы данных',
+                      (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)),
+    'queries': ('db_queries',
+                'Число SQL-запросов за запрос',
+                (1, 2, 3, 5, 10, 20, 50, 100)),
+}
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(ordered, rank):
+    """Перцентиль отсортированной выборки методом ближайшего ранга."""
+    return ordered[max(0, -(-len(ordered) * rank // 100) - 1)]
+
+
+class BudgetExceeded(AssertionError):
+    pass
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Метрики запросов процесса по представлениям.
+
+    Накопительные гистограммы отдаются в формате Prometheus, последние
+    INSTRUMENTATION_WINDOW замеров - как скользящие перцентили.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.samples = {}
+
+    def observe(self, key, values):
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = {
+                    metric: Histogram(buckets)
+                    for metric, (_, _, buckets) in METRICS.items()
+                }
+                self.samples[key] = deque(
+                    maxlen=settings.INSTRUMENTATION_WINDOW)
+            for metric, histogram in self.histograms[key].items():
+                histogram.observe(values[metric])
+            self.samples[key].append(values)
+
+    def summary(self):
+        with self.lock:
+            samples = {key: list(values)
+                       for key, values in self.samples.items()}
+        result = []
+        for (view, method), values in sorted(samples.items()):
+            entry = {'view': view, 'method': method, 'count': len(values)}
+            for metric in METRICS:
+                ordered = sorted(value[metric] for value in values)
+                entry[metric] = {
+                    f'p{rank}': percentile(ordered, rank)
+                    for rank in PERCENTILES
+                }
+            result.append(entry)
+        return result
+
+    def render_prometheus(self):
+        with self.lock:
+            histograms = {
+                key: {metric: (histogram.buckets, list(histogram.counts),
+                               histogram.sum, histogram.count)
+                      for metric, histogram in metrics.items()}
+                for key, metrics in self.histograms.items()
+            }
+        lines = []
+        for metric, (name, help_text, _) in METRICS.items():
+            name = 'foodgram_' + name
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (view, method), metrics in sorted(histograms.items()):
+                buckets, counts, total, count = metrics[metric]
+                labels = f'view="{view}",method="{method}"'
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(
+                        f'{name}_bucket{{{labels},le="{bound}"}} '
+                        f'{cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {total}')
+                lines.append(f'{name}_count{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0
+        self.view_started = None
+        self.view_db_time = 0
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+class MeasuredStream:
+    """Содержимое потокового ответа, после которого закрывается замер.
+
+    Замер закрывается, когда содержимое прочитано до конца или когда
+    сервер закрывает ответ, не дочитав его.
+    """
+
+    def __init__(self, content, stack, on_close):
+        self.content = content
+        self.stack = stack
+        self.on_close = on_close
+        self.closed = False
+
+    def __iter__(self):
+        try:
+            yield from self.content
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.stack.close()
+        self.on_close()
+
+
+def is_strict():
+    strict = settings.INSTRUMENTATION_BUDGET_STRICT
+    if strict is None:
+        return 'PYTEST_CURRENT_TEST' in os.environ
+    return strict
+
+
+class InstrumentationMiddleware:
+    """Считает SQL-запросы и время обработки каждого запроса.
+
+    Время сериализации - время работы представления и отрисовки ответа
+    за вычетом SQL; для представлений DRF это в основном сериализаторы.
+    При превышении бюджета INSTRUMENTATION_BUDGETS пишется
+    предупреждение, а под pytest запрос завершается ошибкой.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.INSTRUMENTATION_ENABLED:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        request._instrumentation = metrics
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.execute))
+            response = self.get_response(request)
+            if response.streaming:
+                # Потоковый ответ выполняет запросы уже после возврата из
+                # представления, поэтому замер закрывается вместе с ним.
+                response.streaming_content = MeasuredStream(
+                    response.streaming_content, stack.pop_all(),
+                    lambda: self.finish(request, metrics, started))
+                return response
+        self.finish(request, metrics, started)
+        return response
+
+    def finish(self, request, metrics, started):
+        finished = time.perf_counter()
+        serialization = 0
+        if metrics.view_started is not None:
+            serialization = max(0, finished - metrics.view_started - (
+                metrics.db_time - metrics.view_db_time))
+        match = request.resolver_match
+        key = (match.view_name if match else '<unmatched>', request.method)
+        values = {
+            'total': finished - started,
+            'db': metrics.db_time,
+            'serialization': serialization,
+            'queries': metrics.queries,
+        }
+        registry.observe(key, values)
+        self.check_budget(key, values)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = getattr(request, '_instrumentation', None)
+        if metrics is not None:
+            metrics.view_started = time.perf_counter()
+            metrics.view_db_time = metrics.db_time
+
+    def check_budget(self, key, values):
+        budgets = settings.INSTRUMENTATION_BUDGETS
+        view, method = key
+        budget = budgets.get(f'{method} {view}')
+        if budget is None:
+            budget = budgets.get(view, budgets.get('*', {}))
+        exceeded = {
+            metric: (values[metric], limit)
+            for metric, limit in budget.items()
+            if values[metric] > limit
+        }
+        if not exceeded:
+            return
+        message = '{} {}: превышен бюджет {}'.format(
+            method, view, ', '.join(
+                f'{metric}={value:g} > {limit:g}'
+                for metric, (value, limit) in exceeded.items()))
+        if is_strict():
+            raise BudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,29 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .instrumentation import registry
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return JSONRenderer().render(data)
+
+
+class MetricsView(APIView):
+    """Метрики процесса: text/plain для Prometheus, ?format=json -
+    скользящие перцентили по последним запросам."""
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PrometheusRenderer, JSONRenderer)
+
+    def get(self, request):
+        if request.accepted_renderer.format == 'json':
+            return Response(registry.summary())
+        return Response(registry.render_prometheus())
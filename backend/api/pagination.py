@@ -0,0 +1,178 @@
+import hashlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (BasePagination, PageNumberPagination,
+                                       _positive_int)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .filters import POPULAR_ORDERING
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор, который кэширует COUNT(*) на короткое время.
+
+    Ключ строится по тексту SQL-запроса без сортировки, поэтому разные
+    сочетания фильтров считаются отдельно. Количество может отставать от
+    базы на RECIPE_COUNT_CACHE_TIMEOUT секунд.
+    """
+
+    @cached_property
+    def count(self):
+        try:
+            sql = str(self.object_list.order_by().values('pk').query)
+        except (AttributeError, EmptyResultSet):
+            return super().count
+        key = 'count:' + hashlib.md5(sql.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, settings.RECIPE_COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class RecipePageNumberPagination(PageNumberPagination):
+    django_paginator_class = CachedCountPaginator
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+
+class FeedPagination(BasePagination):
+    """Keyset-пагинация ленты подписок.
+
+    Курсор - дата публикации и id последнего рецепта страницы, поэтому
+    следующая страница читается по индексу без OFFSET.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор'
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True, cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+
+    # Разбор значений курсора по порядку полей ключа.
+    position_parsers = (parse_datetime, int)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = urlsafe_b64decode(encoded.encode()).decode().split('|')
+            if len(values) != len(self.position_parsers):
+                raise ValueError
+            position = tuple(
+                parse(value)
+                for parse, value in zip(self.position_parsers, values))
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        return urlsafe_b64encode('|'.join(
+            value.isoformat() if isinstance(value, datetime) else str(value)
+            for value in position
+        ).encode()).decode()
+
+    def paginate_keys(self, request, get_page, get_position=None):
+        """Возвращает ключи страницы; get_page(позиция, лимит).
+
+        get_position(ключ) нужен, если ключи сами не являются позициями.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        keys = get_page(self.decode_cursor(request), page_size + 1)
+        self.next_position = None
+        if len(keys) > page_size:
+            keys = keys[:page_size]
+            self.next_position = keys[-1]
+            if get_position is not None:
+                self.next_position = get_position(self.next_position)
+        return keys
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class RecipeCursorPagination(FeedPagination):
+    """Keyset-пагинация списка рецептов.
+
+    Курсор - значения полей сортировки последнего рецепта страницы:
+    pub_date и id, для ordering=popular ещё и favorites_count. Следующая
+    страница выбирается условием «строго после» по всему ключу, поэтому
+    рецепты с одинаковыми значениями не теряются и не повторяются.
+    Порядок поиска по релевантности и подбора по продуктам по этому ключу
+    не продолжить, поэтому с ними курсор не принимается.
+    """
+    ordering = ('-pub_date', '-id')
+    field_parsers = {
+        'favorites_count': int,
+        'pub_date': parse_datetime,
+        'id': int,
+    }
+    unsupported_message = (
+        'Курсор нельзя использовать вместе с поиском и подбором по '
+        'продуктам')
+
+    def check_supported(self, request, view):
+        query_params = request.query_params
+        if (getattr(view, 'action', None) == 'cookable'
+                or query_params.get(api_settings.SEARCH_PARAM, '').strip()):
+            raise ValidationError({
+                self.cursor_query_param: self.unsupported_message})
+
+    def get_ordering(self, request):
+        if request.query_params.get('ordering') == 'popular':
+            return POPULAR_ORDERING
+        return self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.check_supported(request, view)
+        ordering = self.get_ordering(request)
+        fields = [field.lstrip('-') for field in ordering]
+        self.position_parsers = tuple(
+            self.field_parsers[field] for field in fields)
+        queryset = queryset.order_by(*ordering)
+
+        def get_page(position, limit):
+            if position is None:
+                return list(queryset[:limit])
+            after = Q()
+            equal = {}
+            for field, value in zip(fields, position):
+                after |= Q(**equal, **{f'{field}__lt': value})
+                equal[field] = value
+            return list(queryset.filter(after)[:limit])
+
+        return self.paginate_keys(
+            request, get_page,
+            lambda recipe: tuple(getattr(recipe, field) for field in fields))
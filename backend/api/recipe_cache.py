@@ -0,0 +1,110 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from recipes.models import Ingredient, Tag, get_recipe_prefetch_lookups
+
+from .caching import get_catalogue_state, get_shared_cache
+
+RECIPE_VERSION_KEY = 'recipe-version:{}'
+AUTHOR_VERSION_KEY = 'author-version:{}'
+
+
+def get_versions(key_template, ids):
+    shared_cache = get_shared_cache()
+    keys = {pk: key_template.format(pk) for pk in ids}
+    versions = shared_cache.get_many(keys.values())
+    missing = {
+        key: uuid4().hex for key in keys.values() if key not in versions
+    }
+    if missing:
+        shared_cache.set_many(missing, None)
+        versions.update(missing)
+    return {pk: versions[key] for pk, key in keys.items()}
+
+
+def bump_versions(key_template, ids):
+    ids = set(ids)
+
+    def bump():
+        get_shared_cache().set_many({
+            key_template.format(pk): uuid4().hex for pk in ids
+        }, None)
+
+    transaction.on_commit(bump)
+
+
+def get_representation_keys(request, recipes):
+    recipe_versions = get_versions(
+        RECIPE_VERSION_KEY, {recipe.pk for recipe in recipes})
+    author_versions = get_versions(
+        AUTHOR_VERSION_KEY, {recipe.author_id for recipe in recipes})
+    prefix = 'recipe:{}:{}:{}'.format(
+        request.get_host() if request else '',
+        get_catalogue_state(Tag)['version'],
+        get_catalogue_state(Ingredient)['version'],
+    )
+    return {
+        recipe.pk: '{}:{}:{}:{}'.format(
+            prefix, recipe.pk, recipe_versions[recipe.pk],
+            author_versions[recipe.author_id])
+        for recipe in recipes
+    }
+
+
+def render_recipes(serializer, recipes):
+    """Возвращает представления рецептов, по возможности из кэша.
+
+    В кэше хранится общая для всех пользователей часть представления;
+    поля, зависящие от пользователя, сериализатор подставляет поверх неё.
+    """
+    recipes = list(recipes)
+    if not recipes:
+        return []
+    keys = get_representation_keys(serializer.context.get('request'),
+                                   recipes)
+    representations = cache.get_many(keys.values())
+    missing = [
+        recipe for recipe in recipes if keys[recipe.pk] not in representations
+    ]
+    if missing:
+        prefetch_related_objects(missing, *get_recipe_prefetch_lookups())
+        rendered = {
+            keys[recipe.pk]: serializer.serialize(recipe)
+            for recipe in missing
+        }
+        cache.set_many(rendered, settings.RECIPE_CACHE_TIMEOUT)
+        representations.update(rendered)
+    return [
+        serializer.personalize(representations[keys[recipe.pk]], recipe)
+        for recipe in recipes
+    ]
+
+
+def invalidate_recipe(sender, instance, **kwargs):
+    bump_versions(RECIPE_VERSION_KEY, [instance.pk])
+
+
+def invalidate_recipe_amounts(sender, instance, **kwargs):
+    bump_versions(RECIPE_VERSION_KEY, [instance.recipe_id])
+
+
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'pre_clear':
+        recipe_ids = instance.recipes.values_list('pk', flat=True)
+    else:
+        recipe_ids = pk_set
+    bump_versions(RECIPE_VERSION_KEY, recipe_ids)
+
+
+def invalidate_author(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_versions(AUTHOR_VERSION_KEY, [instance.pk])
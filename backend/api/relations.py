@@ -0,0 +1,45 @@
+from django.contrib.auth.models import AnonymousUser
+from django.utils.functional import cached_property
+from recipes.models import FavoriteRecipe, ShoppingCart
+from users.models import Follow
+
+
+class UserRelations:
+    """Подписки, избранное и корзина текущего пользователя.
+
+    Создаётся один раз на запрос. Каждое множество id загружается одним
+    запросом при первом обращении, после чего его используют все
+    сериализаторы: пользователей, рецептов и подписок.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def get_ids(self, queryset, field):
+        if self.user.is_anonymous:
+            return frozenset()
+        return frozenset(
+            queryset.filter(user=self.user).values_list(field, flat=True))
+
+    @cached_property
+    def following(self):
+        return self.get_ids(Follow.objects, 'author_id')
+
+    @cached_property
+    def favorites(self):
+        return self.get_ids(FavoriteRecipe.objects, 'favorite_recipe_id')
+
+    @cached_property
+    def shopping_cart(self):
+        return self.get_ids(ShoppingCart.objects, 'recipe_id')
+
+
+def get_user_relations(request):
+    if request is None:
+        return UserRelations(AnonymousUser())
+    http_request = getattr(request, '_request', request)
+    relations = getattr(http_request, 'user_relations', None)
+    if relations is None or relations.user != request.user:
+        relations = UserRelations(request.user)
+        http_request.user_relations = relations
+    return relations
@@ -0,0 +1,187 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField)
+from django.db import connection, transaction
+from django.db.models import Case, F, Func, IntegerField, Value, When
+from recipes.models import Recipe
+
+from .caching import CatalogueSnapshot
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class ToTsVector(Func):
+    function = 'to_tsvector'
+    template = "%(function)s('{}', %(expressions)s)"
+    output_field = SearchVectorField()
+
+    def __init__(self, expression, config):
+        self.template = self.template.format(config)
+        super().__init__(expression)
+
+
+class PostgresRecipeSearch:
+    """Полнотекстовый поиск средствами Postgres.
+
+    Выражение совпадает с GIN-индексом recipe_search_document_idx,
+    поэтому поиск идёт по индексу.
+    """
+
+    def search(self, queryset, query):
+        config = settings.RECIPE_SEARCH_CONFIG
+        search_query = SearchQuery(query, config=config)
+        return (
+            queryset
+            .annotate(search_vector=ToTsVector('search_document', config))
+            .filter(search_vector=search_query)
+            .annotate(search_rank=SearchRank(F('search_vector'),
+                                             search_query))
+            .order_by('-search_rank', '-pub_date', '-id')
+        )
+
+
+class MemoryRecipeSearch(CatalogueSnapshot):
+    """Инвертированный индекс в памяти процесса для SQLite и тестов.
+
+    Слова запроса сопоставляются с началом слов документа, все слова
+    запроса должны найтись. Релевантность - число вхождений.
+    """
+    model = Recipe
+
+    def build(self):
+        postings = defaultdict(list)
+        documents = Recipe.objects.values_list('id', 'search_document')
+        for recipe_id, document in documents.iterator():
+            for token, count in Counter(tokenize(document)).items():
+                postings[token].append((recipe_id, count))
+        return sorted(postings), postings
+
+    def rank(self, query):
+        tokens, postings = self.get_data()
+        scores = None
+        for word in set(tokenize(query)):
+            word_scores = Counter()
+            position = bisect_left(tokens, word)
+            while (position < len(tokens)
+                   and tokens[position].startswith(word)):
+                for recipe_id, count in postings[tokens[position]]:
+                    word_scores[recipe_id] += count
+                position += 1
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = Counter({
+                    recipe_id: score + word_scores[recipe_id]
+                    for recipe_id, score in scores.items()
+                    if recipe_id in word_scores
+                })
+        return (scores or Counter()).most_common(
+            settings.RECIPE_SEARCH_LIMIT)
+
+    def search(self, queryset, query):
+        ranked = self.rank(query)
+        return (
+            queryset
+            .filter(pk__in=[recipe_id for recipe_id, _ in ranked])
+            .annotate(search_rank=Case(
+                *[When(pk=recipe_id, then=Value(score))
+                  for recipe_id, score in ranked],
+                default=Value(0),
+                output_field=IntegerField(),
+            ))
+            .order_by('-search_rank', '-pub_date', '-id')
+        )
+
+
+memory_recipe_search = MemoryRecipeSearch()
+
+
+def get_search_backend():
+    backend = settings.RECIPE_SEARCH_BACKEND
+    if backend is None:
+        backend = 'postgres' if connection.vendor == 'postgresql' else 'memory'
+    if backend == 'postgres':
+        return PostgresRecipeSearch()
+    return memory_recipe_search
+
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_search_updates():
+    """Отключает обновление документов сигналами внутри блока.
+
+    Сигналы срабатывают на каждую строку, поэтому API, которое меняет
+    рецепт несколькими запросами, обновляет документ само один раз.
+    Сигналы остаются для админки и других путей.
+    """
+    previous = getattr(_deferred, 'active', False)
+    _deferred.active = True
+    try:
+        yield
+    finally:
+        _deferred.active = previous
+
+
+def search_updates_deferred():
+    return getattr(_deferred, 'active', False)
+
+
+def update_search_documents(recipe_ids):
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    Recipe.objects.filter(pk__in=recipe_ids).update_search_documents()
+    if get_search_backend() is memory_recipe_search:
+        transaction.on_commit(memory_recipe_search.bump_version)
+
+
+def recipe_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Новый рецепт получает документ после того, как сохранены его
+    # теги и ингредиенты.
+    if created or search_updates_deferred():
+        return
+    if update_fields and set(update_fields) <= {'image_variants_ready'}:
+        return
+    update_search_documents([instance.pk])
+
+
+def recipe_amounts_changed(sender, instance, **kwargs):
+    if not search_updates_deferred():
+        update_search_documents([instance.recipe_id])
+
+
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if search_updates_deferred():
+        return
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            update_search_documents([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        update_search_documents(pk_set)
+    elif action == 'pre_clear':
+        recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+        transaction.on_commit(lambda: update_search_documents(recipe_ids))
+
+
+def tag_changed(sender, instance, **kwargs):
+    recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+    transaction.on_commit(lambda: update_search_documents(recipe_ids))
+
+
+def ingredient_changed(sender, instance, **kwargs):
+    recipe_ids = list(Recipe.objects.filter(
+        ingredients=instance).values_list('pk', flat=True))
+    transaction.on_commit(lambda: update_search_documents(recipe_ids))
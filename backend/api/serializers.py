@@ -1,10 +1,19 @@
-from drf_extra_fields.fields import Base64ImageField
-from recipes.models import (FavoriteRecipe, Ingredient, IngredientAmount,
-                            Recipe, ShoppingCart, Tag)
+from django.conf import settings
+from django.db import transaction
+from recipes.images import schedule_variants
+from recipes.models import (FeedEntry, Ingredient, IngredientAmount,
+                            Recipe, ShoppingCartIngredient, Tag)
 from rest_framework import serializers
 from users.serializers import UserListSerializer
 from rest_framework.validators import UniqueTogetherValidator
 
+from .cookable import cookable_index
+from .fields import ImageVariantsField, StreamingBase64ImageField
+from .recipe_cache import render_recipes
+from .relations import get_user_relations
+from .search import deferred_search_updates, update_search_documents
+
+SEARCH_DOCUMENT_FIELDS = {'name', 'text', 'tags', 'ingredients'}
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -37,6 +46,13 @@ class IngrediendAmountSerializer(serializers.ModelSerializer):
         ]
 
 
+class CachedRecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if hasattr(data, 'all'):
+            data = data.all()
+        return render_recipes(self.child, data)
+
+
 class RecipeListSerializer(serializers.ModelSerializer):
     author = UserListSerializer(read_only=True)
     ingredients = IngrediendAmountSerializer(
@@ -47,27 +63,40 @@ class RecipeListSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time'
         )
+        list_serializer_class = CachedRecipeListSerializer
+
+    def to_representation(self, instance):
+        return render_recipes(self, [instance])[0]
+
+    def serialize(self, instance):
+        return super().to_representation(instance)
+
+    def personalize(self, representation, instance):
+        representation = representation.copy()
+        representation['author'] = representation['author'].copy()
+        representation['author']['is_subscribed'] = (
+            self.fields['author'].get_is_subscribed(instance.author))
+        representation['is_favorited'] = self.get_is_favorited(instance)
+        representation['is_in_shopping_cart'] = (
+            self.get_is_in_shopping_cart(instance))
+        return representation
 
     def get_is_favorited(self, obj):
-        return (self.context.get('request').user.is_authenticated
-                and FavoriteRecipe.objects.filter(
-                    user=self.context.get('request').user,
-                    favorite_recipe=obj
-        ).exists())
+        relations = get_user_relations(self.context.get('request'))
+        return obj.id in relations.favorites
 
     def get_is_in_shopping_cart(self, obj):
-        return (self.context.get('request').user.is_authenticated
-                and ShoppingCart.objects.filter(
-                    user=self.context.get('request').user,
-                    recipe=obj
-        ).exists())
+        relations = get_user_relations(self.context.get('request'))
+        return obj.id in relations.shopping_cart
 
 
 class IngredientsEditSerializer(serializers.ModelSerializer):
@@ -80,11 +109,14 @@ class IngredientsEditSerializer(serializers.ModelSerializer):
 
 
 class RecipeEditSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(
+    image = StreamingBase64ImageField(
         max_length=None,
         use_url=True)
     ingredients = IngredientsEditSerializer(
         many=True)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False)
     author = serializers.PrimaryKeyRelatedField(
         read_only=True)
 
@@ -92,75 +124,140 @@ class RecipeEditSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = '__all__'
 
+    def validate_ids(self, model, ids, field, message):
+        ids = set(ids)
+        missing = ids - set(
+            model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        if missing:
+            raise serializers.ValidationError({
+                field: message.format(
+                    ', '.join(str(pk) for pk in sorted(missing)))
+            })
+
     def validate(self, data):
-        ingredients = data['ingredients']
-        ingredients_list = []
-        for i in ingredients:
-            ingredient_id = i['id']
-            if ingredient_id in ingredients_list:
+        if 'ingredients' in data:
+            ingredients = data['ingredients']
+            ingredient_ids = [i['id'] for i in ingredients]
+            if len(set(ingredient_ids)) != len(ingredient_ids):
                 raise serializers.ValidationError({
                     'ingredients': 'Ингредиенты не должны повторяться'
                 })
-            ingredients_list.append(ingredient_id)
-            amount = i['amount']
-            if int(amount) < 1:
+            if any(int(i['amount']) < 1 for i in ingredients):
                 raise serializers.ValidationError({
                     'amount': 'Количество ингредиента не меньше 1'
                 })
+            self.validate_ids(Ingredient, ingredient_ids, 'ingredients',
+                              'Ингредиенты не найдены: {}')
 
-        tags = data['tags']
-        tags_list = []
-        for t in tags:
-            if t in tags_list:
+        if 'tags' in data:
+            tags = data['tags']
+            if len(set(tags)) != len(tags):
                 raise serializers.ValidationError({
                     'tags': 'Теги не должны повторяться'
                 })
-            tags_list.append(t)
+            self.validate_ids(Tag, tags, 'tags', 'Теги не найдены: {}')
 
         return data
 
     def create_ingredients(self, ingredients, recipe):
-        for ingredient in ingredients:
-            IngredientAmount.objects.bulk_create([
-                IngredientAmount(
-                    recipe=recipe,
-                    ingredient_id=ingredient.get('id'),
-                    amount=ingredient.get('amount'),)
-            ])
+        if not ingredients:
+            return
+        IngredientAmount.objects.bulk_create([
+            IngredientAmount(
+                recipe=recipe,
+                ingredient_id=ingredient.get('id'),
+                amount=ingredient.get('amount'),)
+            for ingredient in ingredients
+        ])
+        # bulk_create не отправляет сигналы post_save.
+        cookable_index.recipes_changed([recipe.pk])
+
+    def update_ingredients(self, ingredients, recipe):
+        current = {
+            amount.ingredient_id: amount
+            for amount in IngredientAmount.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: amount.amount
+            for ingredient_id, amount in current.items()
+        }
+        requested = {item['id']: item['amount'] for item in ingredients}
+        to_update = []
+        for ingredient_id, amount in current.items():
+            if (ingredient_id in requested
+                    and amount.amount != requested[ingredient_id]):
+                amount.amount = requested[ingredient_id]
+                to_update.append(amount)
+        IngredientAmount.objects.filter(pk__in=[
+            amount.pk for ingredient_id, amount in current.items()
+            if ingredient_id not in requested
+        ]).delete()
+        IngredientAmount.objects.bulk_update(to_update, ['amount'])
+        self.create_ingredients(
+            [item for item in ingredients if item['id'] not in current],
+            recipe)
+        return old_amounts, requested
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
-        self.create_ingredients(ingredients, recipe)
+        with deferred_search_updates():
+            recipe = Recipe.objects.create(**validated_data)
+            recipe.tags.add(*tags)
+            self.create_ingredients(ingredients, recipe)
+        update_search_documents([recipe.pk])
+        FeedEntry.objects.fan_out(recipe)
+        schedule_variants(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        if 'ingredients' in validated_data:
-            ingredients = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self.create_ingredients(ingredients, instance)
-        if 'tags' in validated_data:
-            instance.tags.set(
-                validated_data.pop('tags'))
-        return super().update(
-            instance, validated_data)
+        searchable = bool(SEARCH_DOCUMENT_FIELDS & set(validated_data))
+        with deferred_search_updates():
+            if 'ingredients' in validated_data:
+                old_amounts, new_amounts = self.update_ingredients(
+                    validated_data.pop('ingredients'), instance)
+                ShoppingCartIngredient.objects.change_recipe(
+                    instance, old_amounts, new_amounts)
+            if 'tags' in validated_data:
+                instance.tags.set(
+                    validated_data.pop('tags'))
+            if 'image' in validated_data:
+                validated_data['image_variants_ready'] = False
+            instance = super().update(
+                instance, validated_data)
+        if searchable:
+            update_search_documents([instance.pk])
+        if 'image' in validated_data:
+            schedule_variants(instance)
+        return instance
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.with_author().get(pk=instance.pk)
         return RecipeListSerializer(
             instance,
             context={
-                'request': self.context.get('request')
+                'request': request
             }).data
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(read_only=True)
+    image = serializers.ImageField(read_only=True)
+    image_variants = ImageVariantsField()
     name = serializers.ReadOnlyField()
     cooking_time = serializers.ReadOnlyField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'name',
-                  'image', 'cooking_time')
\ No newline at end of file
+                  'image', 'image_variants', 'cooking_time')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_LIMIT,
+    )
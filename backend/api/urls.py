@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework import routers
 
+from .metrics import MetricsView
 from .views import (IngredientViewSet, RecipeViewSet,
                     TagViewSet)
 
@@ -12,5 +13,6 @@ router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('tags', TagViewSet, basename='tags')
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
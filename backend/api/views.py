@@ -1,34 +1,62 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-from recipes.models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCart,
-                            Tag, IngredientAmount)
+from django.db import transaction
+from django_filters.rest_framework import DjangoFilterBackend
+from recipes.models import (FavoriteRecipe, FeedEntry, Ingredient, Recipe,
+                            ShoppingCart, ShoppingCartIngredient, Tag)
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (SAFE_METHODS,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
-from django.db.models import Sum
-from .filters import IngredientFilter, RecipesFilter
+from .autocomplete import ingredient_index
+from .caching import CatalogueCacheMixin
+from .cookable import cookable_index
+from .exporters import SHOPPING_LIST_EXPORTERS
+from .filters import IngredientFilter, RecipeSearchFilter, RecipesFilter
+from .pagination import (FeedPagination, RecipeCursorPagination,
+                         RecipePageNumberPagination)
 from .permissions import IsAuthorOrReadOnly
+from .search import deferred_search_updates
 from rest_framework.permissions import IsAuthenticated
-from .serializers import (IngredientSerializer, RecipeListSerializer,
-                          RecipeEditSerializer, ShortRecipeSerializer,
-                          TagSerializer,)
+from .serializers import (IngredientSerializer, RecipeIdsSerializer,
+                          RecipeListSerializer, RecipeEditSerializer,
+                          ShortRecipeSerializer, TagSerializer,)
 
 User = get_user_model()
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+SHOPPING_LIST_CHUNK_SIZE = 500
+
+class TagViewSet(CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly,]
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
+    filter_backends = [DjangoFilterBackend, RecipeSearchFilter]
     filterset_class = RecipesFilter
+    lookup_value_regex = r'\d+'
+
+    def get_queryset(self):
+        return Recipe.objects.with_author()
+
+    @property
+    def paginator(self):
+        # Курсорная пагинация включается параметром ?cursor=
+        # (пустым для первой страницы), остальные клиенты получают
+        # постраничную выдачу с кэшированным количеством.
+        if not hasattr(self, '_paginator'):
+            if RecipeCursorPagination.cursor_query_param in (
+                    self.request.query_params):
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = RecipePageNumberPagination()
+        return self._paginator
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -38,78 +66,191 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        # Документ удаляемого рецепта перестраивать незачем.
+        with deferred_search_updates():
+            instance.delete()
+
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticatedOrReadOnly,))
+    def cookable(self, request):
+        ingredient_ids = []
+        for value in request.query_params.getlist('ingredients'):
+            for item in value.split(','):
+                if not item.strip().isdigit():
+                    raise ValidationError({
+                        'ingredients': 'Ожидаются id ингредиентов'})
+                ingredient_ids.append(int(item))
+        if not ingredient_ids:
+            raise ValidationError({
+                'ingredients': 'Укажите хотя бы один ингредиент'})
+        try:
+            min_coverage = float(
+                request.query_params.get('min_coverage', 0))
+        except ValueError:
+            raise ValidationError({
+                'min_coverage': 'Ожидается число от 0 до 1'})
+
+        ranked = cookable_index.rank(ingredient_ids, min_coverage,
+                                     settings.RECIPE_SEARCH_LIMIT)
+        coverage = {recipe_id: value for recipe_id, value, _ in ranked}
+        # Порядок задаёт индекс, поэтому страница вырезается из списка id,
+        # а из базы читаются только её рецепты. Фильтры списка рецептов
+        # применяются одним лёгким запросом, только если они переданы.
+        recipe_ids = list(coverage)
+        filter_params = set(RecipesFilter.base_filters) | {
+            RecipeSearchFilter.search_param}
+        if filter_params & set(request.query_params):
+            matched = set(
+                self.filter_queryset(self.get_queryset())
+                .filter(pk__in=recipe_ids)
+                .values_list('pk', flat=True)
+            )
+            recipe_ids = [
+                recipe_id for recipe_id in recipe_ids if recipe_id in matched
+            ]
+        page = self.paginate_queryset(recipe_ids)
+        recipes = self.get_queryset().in_bulk(page)
+        data = RecipeListSerializer(
+            [recipes[recipe_id] for recipe_id in page
+             if recipe_id in recipes],
+            many=True, context=self.get_serializer_context()).data
+        for item in data:
+            item['coverage'] = round(coverage[item['id']], 3)
+        return self.get_paginated_response(data)
+
+    def add_recipe(self, manager, error):
+        recipe_id = int(self.kwargs['pk'])
+        if not manager.add(self.request.user, [recipe_id]):
+            get_object_or_404(Recipe, pk=recipe_id)
+            return Response({'errors': error},
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer = ShortRecipeSerializer(
+            get_object_or_404(Recipe, pk=recipe_id),
+            context={'request': self.request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def remove_recipe(self, manager, error, detail):
+        recipe_id = int(self.kwargs['pk'])
+        if not manager.remove(self.request.user, [recipe_id]):
+            get_object_or_404(Recipe, pk=recipe_id)
+            return Response({'errors': error},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'detail': detail},
+                        status=status.HTTP_204_NO_CONTENT)
+
+    def change_recipes(self, manager):
+        serializer = RecipeIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+
+        if self.request.method == 'DELETE':
+            manager.remove(self.request.user, recipe_ids)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        with transaction.atomic():
+            added = manager.add(self.request.user, recipe_ids)
+            # Не вставлены либо уже добавленные, либо несуществующие
+            # рецепты; база проверяется только в этом случае.
+            missing = set(recipe_ids).difference(added)
+            if missing:
+                missing.difference_update(Recipe.objects.filter(
+                    pk__in=missing).values_list('pk', flat=True))
+            if missing:
+                raise ValidationError({'recipes': 'Рецепты не найдены: {}'
+                                       .format(sorted(missing))})
+        return Response({'recipes': added}, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(IsAuthenticated,))
     def favorite(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-
         if request.method == 'POST':
-            serializer = ShortRecipeSerializer(recipe, data=request.data,
-                                          context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            if not FavoriteRecipe.objects.filter(user=request.user,
-                                           favorite_recipe=recipe).exists():
-                FavoriteRecipe.objects.create(user=request.user,
-                                              favorite_recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response({'errors': 'Рецепт уже добавлен в избранное'},
-                            status=status.HTTP_400_BAD_REQUEST)
+            return self.add_recipe(FavoriteRecipe.objects,
+                                   'Рецепт уже добавлен в избранное')
+        return self.remove_recipe(FavoriteRecipe.objects,
+                                  'Рецепта нет в избранном',
+                                  'Рецепт удален из избранного')
 
-        if request.method == 'DELETE':
-            get_object_or_404(FavoriteRecipe, user=request.user,
-                              favorite_recipe=recipe).delete()
-            return Response({'detail': 'Рецепт удален из избранного'},
-                            status=status.HTTP_204_NO_CONTENT)
+    @action(detail=False, methods=['post', 'delete'], url_path='favorite',
+            permission_classes=(IsAuthenticated,))
+    def favorite_batch(self, request):
+        return self.change_recipes(FavoriteRecipe.objects)
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(IsAuthenticated,),
             pagination_class=None)
     def shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-
         if request.method == 'POST':
-            serializer = ShortRecipeSerializer(recipe, data=request.data,
-                                          context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            if not ShoppingCart.objects.filter(user=request.user,
-                                                recipe=recipe).exists():
-                ShoppingCart.objects.create(user=request.user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response({'errors': 'Рецепт уже добавлен в список покупок'},
-                            status=status.HTTP_400_BAD_REQUEST)
+            return self.add_recipe(ShoppingCart.objects,
+                                   'Рецепт уже добавлен в список покупок')
+        return self.remove_recipe(ShoppingCart.objects,
+                                  'Рецепта нет в списке покупок',
+                                  'Рецепт удален из списка покупок')
 
-        if request.method == 'DELETE':
-            get_object_or_404(ShoppingCart, user=request.user,
-                              recipe=recipe).delete()
-            return Response(
-                {'detail': 'Рецепт удален из списка покупок'},
-                status=status.HTTP_204_NO_CONTENT
-            )
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart', permission_classes=(IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        return self.change_recipes(ShoppingCart.objects)
+
+    @action(detail=False, methods=['delete'], url_path='shopping_cart/clear',
+            permission_classes=(IsAuthenticated,))
+    def clear_shopping_cart(self, request):
+        ShoppingCart.objects.clear(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['post'],
+            url_path='shopping_cart/from_favorites',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_from_favorites(self, request):
+        added = ShoppingCart.objects.add_from(request.user,
+                                              FavoriteRecipe.objects)
+        return Response({'recipes': added}, status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=['get'],
             permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        paginator = FeedPagination()
+        keys = paginator.paginate_keys(
+            request, lambda position, limit: FeedEntry.objects.get_page(
+                request.user, position, limit))
+        recipes = Recipe.objects.with_author().filter(
+            pk__in=[recipe_id for _, recipe_id in keys])
+        serializer = RecipeListSerializer(
+            recipes, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=SHOPPING_LIST_EXPORTERS)
     def download_shopping_cart(self, request):
         ingredients = (
-            IngredientAmount.objects
-            .filter(recipe__recipe_shopping_cart__user=request.user)
-            .values('ingredient')
-            .annotate(total_amount=Sum('amount'))
+            ShoppingCartIngredient.objects
+            .filter(user=request.user)
             .values_list('ingredient__name', 'total_amount',
                          'ingredient__measurement_unit')
+            .order_by('ingredient__name')
+            .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
         )
-        file_list = []
-        [file_list.append(
-            '{} - {} {}.'.format(*ingredient)) for ingredient in ingredients]
-        file = HttpResponse('Cписок покупок:\n' + '\n'.join(file_list),
-                            content_type='text/plain')
-        file['Content-Disposition'] = (f'attachment; filename=list-to-buy.txt')
-        return file
-
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+        return request.accepted_renderer.get_response(ingredients)
+
+class IngredientViewSet(CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
-    filterset_class = IngredientFilter
\ No newline at end of file
+    filterset_class = IngredientFilter
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, self.search)
+
+    def search(self):
+        request = self.request
+        name = request.query_params.get('name')
+        if not name:
+            return Response(ingredient_index.all())
+        limit = request.query_params.get('limit')
+        if limit is not None and limit.isdigit():
+            limit = min(int(limit), settings.INGREDIENT_SEARCH_LIMIT)
+        else:
+            limit = None
+        return Response(ingredient_index.search(name, limit))
\ No newline at end of file
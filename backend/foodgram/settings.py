@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 from dotenv import load_dotenv
 
 import os
+import tempfile
 
 load_dotenv()
 
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -94,6 +96,126 @@ DATABASES = {
 }
 
 
+# Кэш по умолчанию - в памяти процесса: в нём лежат объёмные записи,
+# в ключ которых уже входит версия (представления рецептов, ответы
+# справочников, количества). Сами версии и номера изменений должны быть
+# общими для воркеров gunicorn и команд manage.py, их немного и пишутся
+# они только при изменениях, поэтому для них отдельный файловый кэш;
+# в продакшене его можно заменить на memcached или redis.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES',
+                                         default=100000)),
+        },
+    },
+    'shared': {
+        'BACKEND': os.getenv(
+            'SHARED_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'SHARED_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram-cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('SHARED_CACHE_MAX_ENTRIES',
+                                         default=100000)),
+        },
+    },
+}
+
+CATALOGUE_CACHE_TIMEOUT = 60 * 60 * 24
+
+RECIPE_CACHE_TIMEOUT = 60 * 60 * 24
+
+RECIPE_COUNT_CACHE_TIMEOUT = 30
+
+# None - Postgres tsvector для PostgreSQL, иначе индекс в памяти процесса.
+RECIPE_SEARCH_BACKEND = os.getenv('RECIPE_SEARCH_BACKEND', default=None)
+
+RECIPE_SEARCH_CONFIG = 'russian'
+
+RECIPE_SEARCH_LIMIT = 1000
+
+# Сколько изменений процесс применяет к индексу подбора по продуктам,
+# прежде чем перестроить его целиком.
+COOKABLE_INDEX_MAX_CHANGES = 1000
+
+# Уменьшенные копии картинок рецептов: имя -> (ширина, высота). Копии с
+# другими размерами, форматом или качеством получают новые имена, после
+# смены настроек их строит команда generate_image_variants --all.
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (150, 150),
+    'card': (300, 300),
+    'full': (1280, 1280),
+}
+
+RECIPE_IMAGE_VARIANT_FORMAT = 'WEBP'
+
+RECIPE_IMAGE_QUALITY = 80
+
+# 0 - копии строятся в потоке запроса после фиксации транзакции.
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+RECIPE_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+
+RECIPE_IMAGE_SPOOL_SIZE = 1024 * 1024
+
+# Рецепты авторов с большим числом подписчиков подмешиваются в ленту при
+# чтении, а не раскладываются по лентам при публикации.
+FEED_FANOUT_LIMIT = 10000
+
+FEED_PULL_AUTHORS_CACHE_TIMEOUT = 60 * 5
+
+FEED_BACKFILL_SIZE = 50
+
+INSTRUMENTATION_ENABLED = os.getenv(
+    'INSTRUMENTATION_ENABLED', default='True') == 'True'
+
+# Сколько последних запросов каждого представления хранится для
+# перцентилей в /api/metrics/?format=json.
+INSTRUMENTATION_WINDOW = 1000
+
+# Бюджеты представлений: ключ - имя представления, можно с методом
+# ('GET api:recipes-list'); '*' - для остальных. queries - число SQL,
+# total, db и serialization - секунды.
+INSTRUMENTATION_BUDGETS = {
+    '*': {'queries': 20},
+    'GET api:recipes-list': {'queries': 10},
+    'POST api:recipes-list': {'queries': 40},
+    'GET api:recipes-detail': {'queries': 8},
+    'PATCH api:recipes-detail': {'queries': 40},
+    'GET api:recipes-feed': {'queries': 8},
+    'GET api:recipes-download-shopping-cart': {'queries': 5},
+    'GET api:ingredients-list': {'queries': 3},
+    'GET api:tags-list': {'queries': 3},
+    'GET users:users-list': {'queries': 6},
+    'GET users:users-subscriptions': {'queries': 8},
+}
+
+# None - строгий режим только под pytest: превышение бюджета - ошибка.
+INSTRUMENTATION_BUDGET_STRICT = None
+
+# Снимки пользователей по токенам для аутентификации: сколько держать в
+# памяти процесса и сколько секунд. Столько же другие процессы могут
+# принимать токен после выхода пользователя. Общий кэш держит снимки
+# TOKEN_AUTH_SHARED_CACHE_TIMEOUT секунд, 0 - не использовать его; с
+# LocMemCache, который у каждого процесса свой, он не используется.
+# Изменения пользователя в обход сигналов, например деактивация через
+# queryset.update(), снимки не сбрасывают: с общим кэшем токен
+# принимается ещё до 300 секунд, без него - до 10 секунд.
+TOKEN_AUTH_CACHE_SIZE = 10000
+
+TOKEN_AUTH_CACHE_TIMEOUT = 10
+
+TOKEN_AUTH_SHARED_CACHE_TIMEOUT = 60 * 5
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -140,6 +262,14 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 AUTH_USER_MODEL = 'users.User'
 
+INGREDIENT_SEARCH_LIMIT = 50
+
+RECIPE_BATCH_LIMIT = 100
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
 }
@@ -149,7 +279,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachingTokenAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS':
         'rest_framework.pagination.PageNumberPagination',
@@ -0,0 +1,28 @@
+import os
+
+from .settings import *  # noqa: F401,F403
+
+# Тесты не требуют PostgreSQL и общего кэша. С DB_ENGINE и остальными
+# переменными окружения базы они идут на PostgreSQL.
+if 'DB_ENGINE' not in os.environ:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'foodgram-test',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'foodgram-test-shared',
+    },
+}
+
+RECIPE_IMAGE_WORKERS = 0
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
@@ -1,34 +1,90 @@
+from contextlib import contextmanager
+
 from django.contrib import admin
-from django.db.models import Count
+from django.db import transaction
 
 from .models import (FavoriteRecipe, Ingredient, IngredientAmount, Recipe,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingCartIngredient, Tag)
+
+
+class RecipeAmountsAdminMixin:
+    """Переносит правку ингредиентов рецепта в списки покупок."""
+
+    @contextmanager
+    def changing_amounts(self, recipe_ids):
+        aggregates = ShoppingCartIngredient.objects
+        with transaction.atomic():
+            old_amounts = {
+                recipe_id: aggregates.get_recipe_amounts([recipe_id])
+                for recipe_id in set(recipe_ids)
+            }
+            yield
+            for recipe_id, amounts in old_amounts.items():
+                aggregates.change_recipe(
+                    recipe_id, amounts,
+                    aggregates.get_recipe_amounts([recipe_id]))
+
+    def save_model(self, request, obj, form, change):
+        recipe_ids = [obj.recipe_id]
+        if change:
+            recipe_ids.append(IngredientAmount.objects.get(
+                pk=obj.pk).recipe_id)
+        with self.changing_amounts(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with self.changing_amounts([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with self.changing_amounts(
+                queryset.values_list('recipe_id', flat=True)):
+            super().delete_queryset(request, queryset)
+
+
+class RecipeLinkAdminMixin:
+    """Обновляет счётчики и списки покупок при правке связей в админке."""
+    target_field = None
+
+    def unlink(self, obj):
+        self.model.objects.changed(
+            obj.user, [getattr(obj, self.target_field + '_id')], -1)
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            if change:
+                self.unlink(self.model.objects.get(pk=obj.pk))
+            super().save_model(request, obj, form, change)
+            self.model.objects.changed(
+                obj.user, [getattr(obj, self.target_field + '_id')], 1)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            self.unlink(obj)
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            for obj in queryset.select_related('user'):
+                self.unlink(obj)
+            super().delete_queryset(request, queryset)
+
 
 @admin.register(IngredientAmount)
-class IngredientAmountAdmin(admin.ModelAdmin):
+class IngredientAmountAdmin(RecipeAmountsAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'ingredient', 'recipe', 'amount')
     empty_value_display = '---'
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = (
-        'id', 'name', 'author', 'text', 'pub_date', 'favorite_count'
+        'id', 'name', 'author', 'text', 'pub_date', 'favorites_count',
+        'in_carts_count'
     )
     list_filter = ('name', 'author', 'tags')
     search_fields = ('name',)
     empy_value_display = '---'
 
-    def favorite_count(self, obj):
-        return obj.obj_count
-
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        return queryset.annotate(
-            obj_count=Count('favorite_recipe', distinct=True),
-        )
-    
-    favorite_count.short_description = "Количество добавлений в избранное"
-
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = (
@@ -46,7 +102,8 @@ class TagAdmin(admin.ModelAdmin):
     empy_value_display = '---'
 
 @admin.register(FavoriteRecipe)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(RecipeLinkAdminMixin, admin.ModelAdmin):
+    target_field = 'favorite_recipe'
     list_display = (
         'id', 'user', 'favorite_recipe'
     )
@@ -54,9 +111,18 @@ class FavoriteAdmin(admin.ModelAdmin):
     empy_value_display = '---'
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(RecipeLinkAdminMixin, admin.ModelAdmin):
+    target_field = 'recipe'
     list_display = (
         'id', 'user', 'recipe'
     )
     list_filter = ('user', 'recipe')
-    empy_value_display = '---'
\ No newline at end of file
+    empy_value_display = '---'
+
+@admin.register(ShoppingCartIngredient)
+class ShoppingCartIngredientAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'user', 'ingredient', 'total_amount'
+    )
+    list_filter = ('user',)
+    empty_value_display = '---'
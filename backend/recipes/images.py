@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+VARIANT_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_variant_format():
+    variant_format = settings.RECIPE_IMAGE_VARIANT_FORMAT
+    if variant_format == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return variant_format
+
+
+def get_variant_name(name, variant):
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    variant_format = get_variant_format()
+    # Копии отдаются как неизменяемые, поэтому в имя входит хеш настроек:
+    # после смены размеров, формата или качества у копий новые адреса.
+    # Меньшие размеры получаются из больших, так что учитываются все.
+    options = hashlib.sha1(repr((
+        sorted(settings.RECIPE_IMAGE_VARIANTS.items()), variant_format,
+        settings.RECIPE_IMAGE_QUALITY,
+    )).encode()).hexdigest()[:8]
+    return posixpath.join(directory, 'variants', '{}_{}-{}.{}'.format(
+        stem, variant, options, VARIANT_EXTENSIONS[variant_format]))
+
+
+def get_variant_urls(recipe):
+    """Ссылки на уменьшенные копии картинки рецепта.
+
+    Пока копии не готовы, для всех размеров отдаётся оригинал.
+    """
+    if not recipe.image:
+        return None
+    if not recipe.image_variants_ready:
+        url = recipe.image.url
+        return {variant: url for variant in settings.RECIPE_IMAGE_VARIANTS}
+    return {
+        variant: default_storage.url(
+            get_variant_name(recipe.image.name, variant))
+        for variant in settings.RECIPE_IMAGE_VARIANTS
+    }
+
+
+def render_variants(name):
+    variant_format = get_variant_format()
+    variants = sorted(settings.RECIPE_IMAGE_VARIANTS.items(),
+                      key=lambda item: item[1], reverse=True)
+    # Имя оригинала - хеш содержимого, поэтому готовые копии той же
+    # картинки подходят и другим рецептам. Готовые файлы не
+    # перезаписываются: по их адресам отдаётся неизменяемый ответ.
+    names = {
+        variant: get_variant_name(name, variant) for variant, _ in variants
+    }
+    missing = {
+        variant for variant, variant_name in names.items()
+        if not default_storage.exists(variant_name)
+    }
+    if not missing:
+        return
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        # JPEG декодируется сразу в уменьшенном масштабе, поэтому
+        # большой оригинал не распаковывается в память целиком.
+        image.draft('RGB', variants[0][1])
+        image = ImageOps.exif_transpose(image)
+        if variant_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+            image = image.convert(
+                'RGBA' if variant_format == 'WEBP'
+                and 'A' in image.getbands() else 'RGB')
+        # Каждый следующий размер получается из предыдущего, меньшего.
+        for variant, size in variants:
+            image.thumbnail(size, Image.LANCZOS)
+            if variant not in missing:
+                continue
+            buffer = BytesIO()
+            image.save(buffer, variant_format,
+                       quality=settings.RECIPE_IMAGE_QUALITY)
+            default_storage.save(names[variant],
+                                 ContentFile(buffer.getvalue()))
+
+
+def generate_variants(recipe_id, name):
+    from .models import Recipe
+
+    try:
+        render_variants(name)
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', name)
+        return False
+    recipe = Recipe.objects.filter(pk=recipe_id, image=name).first()
+    if recipe is not None:
+        recipe.image_variants_ready = True
+        recipe.save(update_fields=['image_variants_ready'])
+    return True
+
+
+def _generate_in_worker(recipe_id, name):
+    try:
+        generate_variants(recipe_id, name)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images')
+        return _executor
+
+
+def schedule_variants(recipe):
+    """Ставит обработку картинки в очередь после фиксации транзакции.
+
+    При RECIPE_IMAGE_WORKERS = 0 копии строятся сразу в том же потоке.
+    """
+    recipe_id, name = recipe.pk, recipe.image.name
+
+    def submit():
+        if settings.RECIPE_IMAGE_WORKERS:
+            get_executor().submit(_generate_in_worker, recipe_id, name)
+        else:
+            generate_variants(recipe_id, name)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,424 @@
+import io
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from base64 import b64encode
+from datetime import timedelta
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.instrumentation import RequestMetrics, percentile
+from recipes.models import (FavoriteRecipe, FeedEntry, Ingredient,
+                            IngredientAmount, Recipe, ShoppingCart,
+                            ShoppingCartIngredient, Tag)
+from users.models import Follow, User
+
+from .load_ingredients import DEFAULT_PATH, read_csv
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F5B041', 'dessert'),
+    ('Выпечка', '#A04000', 'bakery'),
+    ('Суп', '#2E86C1', 'soup'),
+    ('Салат', '#28B463', 'salad'),
+    ('Напиток', '#AF7AC5', 'drink'),
+)
+AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 300, 500, 1000)
+SCENARIOS = (
+    'recipe_list',
+    'recipe_list_tags',
+    'recipe_list_author',
+    'recipe_list_favorited',
+    'recipe_list_in_cart',
+    'recipe_list_popular',
+    'recipe_detail',
+    'subscriptions',
+    'download_shopping_cart',
+    'ingredient_search',
+    # Создание меняет данные, поэтому выполняется последним.
+    'recipe_create',
+)
+PERCENTILES = (50, 95, 99)
+MEMORY_ITERATIONS = 5
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'foodgram-benchmark',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'foodgram-benchmark-shared',
+    },
+}
+
+
+def zipf_weights(size):
+    # Немногие авторы и рецепты собирают большую часть подписок и
+    # добавлений, как на настоящем сайте.
+    return list(accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+def weighted_sample(rng, population, cum_weights, k):
+    k = min(k, len(population))
+    chosen = set()
+    while len(chosen) < k:
+        chosen.update(rng.choices(population, cum_weights=cum_weights,
+                                  k=k - len(chosen)))
+    return chosen
+
+
+class Command(BaseCommand):
+    help = ('Заполняет тестовую базу синтетическими данными и замеряет '
+            'время ответа, число SQL-запросов и пик памяти основных '
+            'эндпоинтов API; результат выводится в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--follows', type=int, default=10,
+                            help='подписок на пользователя')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='рецептов в избранном у пользователя')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='рецептов в корзине у пользователя')
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=15)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='замеряемых запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--scenario', action='append',
+                            choices=SCENARIOS, dest='scenarios',
+                            help='по умолчанию выполняются все')
+        parser.add_argument('--ingredients-path', default=DEFAULT_PATH)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='файл для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужно хотя бы 2 пользователя и 1 рецепт')
+        if options['requests'] < 1:
+            raise CommandError('Нужен хотя бы один замеряемый запрос')
+        if not (1 <= options['min_ingredients']
+                <= options['max_ingredients']):
+            raise CommandError('Неверный диапазон числа ингредиентов')
+        self.rng = random.Random(options['seed'])
+
+        # Замеры идут в отдельной тестовой базе (SQLite в памяти или
+        # test_<имя> в Postgres), с отдельным кэшем и каталогом медиа.
+        # Картинки обрабатываются в потоке запроса, чтобы фоновые
+        # потоки не искажали замеры.
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root,
+                                      CACHES=BENCHMARK_CACHES,
+                                      RECIPE_IMAGE_WORKERS=0):
+                report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+            self.stderr.write(f'Отчёт записан в {options["output"]}')
+        else:
+            self.stdout.write(output)
+
+    def run(self, options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            dataset = self.generate(options)
+        generation_time = time.perf_counter() - started
+        self.stderr.write(f'Данные созданы за {generation_time:.1f} с')
+
+        client = Client()
+        scenarios = {}
+        for name in options['scenarios'] or SCENARIOS:
+            scenarios[name] = self.measure(
+                client, name, options['requests'], options['warmup'])
+            self.stderr.write('{}: p50 {} мс'.format(
+                name, scenarios[name]['latency_ms']['p50']))
+        return {
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'scale': {
+                key: options[key]
+                for key in ('users', 'recipes', 'follows', 'favorites',
+                            'cart', 'min_ingredients', 'max_ingredients')
+            },
+            'dataset': dataset,
+            'generation_seconds': round(generation_time, 3),
+            'requests': options['requests'],
+            'scenarios': scenarios,
+        }
+
+    def generate(self, options):
+        rng = self.rng
+        with open(options['ingredients_path'], encoding='utf-8') as file:
+            Ingredient.objects.bulk_create(
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in read_csv(file))
+        self.ingredients = dict(
+            Ingredient.objects.values_list('pk', 'name'))
+        if not self.ingredients:
+            raise CommandError('Файл ингредиентов пуст')
+        ingredient_ids = list(self.ingredients)
+
+        Tag.objects.bulk_create(
+            Tag(name=name, color=color, slug=slug)
+            for name, color, slug in TAGS)
+        self.tags = dict(Tag.objects.values_list('pk', 'slug'))
+        tag_ids = list(self.tags)
+
+        password = make_password('benchmark')
+        User.objects.bulk_create(
+            (User(username=f'user{number}',
+                  email=f'user{number}@example.com',
+                  first_name='Имя', last_name='Фамилия',
+                  password=password)
+             for number in range(options['users'])))
+        self.users = list(User.objects.order_by('pk')
+                          .values_list('pk', flat=True))
+        Token.objects.bulk_create(
+            (Token(user_id=user_id, key=Token.generate_key())
+             for user_id in self.users))
+        self.tokens = dict(Token.objects.values_list('user_id', 'key'))
+        self.image_name, self.image = self.create_image()
+
+        authors_weights = zipf_weights(len(self.users))
+        authors = rng.choices(self.users, cum_weights=authors_weights,
+                              k=options['recipes'])
+        Recipe.objects.bulk_create(
+            (Recipe(author_id=author_id, name=f'Рецепт {number}',
+                    text='Смешать все ингредиенты и готовить до '
+                         'готовности.',
+                    cooking_time=rng.randint(5, 180),
+                    image=self.image_name)
+             for number, author_id in enumerate(authors)))
+        recipes = list(Recipe.objects.order_by('pk'))
+        now = timezone.now()
+        for recipe in recipes:
+            recipe.pub_date = now - timedelta(
+                seconds=rng.randrange(365 * 24 * 60 * 60))
+        Recipe.objects.bulk_update(recipes, ['pub_date'], batch_size=500)
+        self.recipes = [recipe.pk for recipe in recipes]
+
+        low, high = options['min_ingredients'], options['max_ingredients']
+        amounts = []
+        recipe_tags = []
+        for recipe_id in self.recipes:
+            size = round(rng.triangular(low, high, low + (high - low) / 3))
+            for ingredient_id in rng.sample(
+                    ingredient_ids, min(size, len(ingredient_ids))):
+                amounts.append(IngredientAmount(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id,
+                    amount=rng.choice(AMOUNTS)))
+            for tag_id in rng.sample(tag_ids, rng.randint(1, 3)):
+                recipe_tags.append(Recipe.tags.through(
+                    recipe_id=recipe_id, tag_id=tag_id))
+        IngredientAmount.objects.bulk_create(amounts)
+        Recipe.tags.through.objects.bulk_create(recipe_tags)
+
+        recipe_weights = zipf_weights(len(self.recipes))
+        follows = []
+        favorites = []
+        carts = []
+        for user_id in self.users:
+            for author_id in weighted_sample(
+                    rng, self.users, authors_weights, options['follows']):
+                if author_id != user_id:
+                    follows.append(Follow(user_id=user_id,
+                                          author_id=author_id))
+            for recipe_id in weighted_sample(
+                    rng, self.recipes, recipe_weights,
+                    options['favorites']):
+                favorites.append(FavoriteRecipe(
+                    user_id=user_id, favorite_recipe_id=recipe_id))
+            for recipe_id in weighted_sample(
+                    rng, self.recipes, recipe_weights, options['cart']):
+                carts.append(ShoppingCart(user_id=user_id,
+                                          recipe_id=recipe_id))
+        Follow.objects.bulk_create(follows)
+        FavoriteRecipe.objects.bulk_create(favorites)
+        ShoppingCart.objects.bulk_create(carts)
+
+        Recipe.objects.all().update_search_documents()
+        Recipe.objects.all().reconcile_counters()
+        ShoppingCartIngredient.objects.rebuild()
+        feed = self.fill_feeds(recipes, follows)
+        return {
+            'users': len(self.users),
+            'ingredients': len(ingredient_ids),
+            'recipes': len(self.recipes),
+            'ingredient_amounts': len(amounts),
+            'follows': len(follows),
+            'favorites': len(favorites),
+            'shopping_cart': len(carts),
+            'feed_entries': feed,
+        }
+
+    def create_image(self):
+        image = Image.new('RGB', (640, 480), (224, 120, 64))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        data = buffer.getvalue()
+        field = Recipe._meta.get_field('image')
+        name = field.storage.save(
+            field.generate_filename(None, 'benchmark.jpg'),
+            ContentFile(data))
+        return name, 'data:image/jpeg;base64,' + b64encode(data).decode()
+
+    def fill_feeds(self, recipes, follows):
+        # То же, что FeedEntryManager.follow, но без запроса на подписку.
+        by_author = {}
+        for recipe in sorted(recipes, key=lambda recipe: (
+                recipe.pub_date, recipe.pk), reverse=True):
+            by_author.setdefault(recipe.author_id, []).append(recipe)
+        pull_authors = FeedEntry.objects.get_pull_authors()
+        entries = [
+            FeedEntry(user_id=follow.user_id, recipe_id=recipe.pk,
+                      author_id=recipe.author_id, pub_date=recipe.pub_date)
+            for follow in follows if follow.author_id not in pull_authors
+            for recipe in by_author.get(follow.author_id, ())[
+                :settings.FEED_BACKFILL_SIZE]
+        ]
+        FeedEntry.objects.bulk_create(entries)
+        return len(entries)
+
+    def request_recipe_list(self):
+        return 'get', '/api/recipes/', {'limit': 6}, None
+
+    def request_recipe_list_tags(self):
+        slugs = self.rng.sample(list(self.tags.values()), 2)
+        return ('get', '/api/recipes/', {'limit': 6, 'tags': slugs},
+                self.rng.choice(self.users))
+
+    def request_recipe_list_author(self):
+        return ('get', '/api/recipes/',
+                {'limit': 6, 'author': self.rng.choice(self.users)},
+                self.rng.choice(self.users))
+
+    def request_recipe_list_favorited(self):
+        return ('get', '/api/recipes/', {'limit': 6, 'is_favorited': 1},
+                self.rng.choice(self.users))
+
+    def request_recipe_list_in_cart(self):
+        return ('get', '/api/recipes/',
+                {'limit': 6, 'is_in_shopping_cart': 1},
+                self.rng.choice(self.users))
+
+    def request_recipe_list_popular(self):
+        return ('get', '/api/recipes/', {'limit': 6, 'ordering': 'popular'},
+                self.rng.choice(self.users))
+
+    def request_recipe_detail(self):
+        return ('get', f'/api/recipes/{self.rng.choice(self.recipes)}/',
+                None, self.rng.choice(self.users))
+
+    def request_subscriptions(self):
+        return ('get', '/api/users/subscriptions/',
+                {'limit': 6, 'recipes_limit': 3},
+                self.rng.choice(self.users))
+
+    def request_download_shopping_cart(self):
+        return ('get', '/api/recipes/download_shopping_cart/', None,
+                self.rng.choice(self.users))
+
+    def request_ingredient_search(self):
+        name = self.rng.choice(list(self.ingredients.values()))
+        return ('get', '/api/ingredients/',
+                {'name': name[:self.rng.randint(1, 4)]}, None)
+
+    def request_recipe_create(self):
+        rng = self.rng
+        return 'post', '/api/recipes/', {
+            'name': 'Новый рецепт',
+            'text': 'Смешать все ингредиенты.',
+            'cooking_time': rng.randint(5, 180),
+            'image': self.image,
+            'tags': rng.sample(list(self.tags), 2),
+            'ingredients': [
+                {'id': ingredient_id, 'amount': rng.choice(AMOUNTS)}
+                for ingredient_id in rng.sample(list(self.ingredients), 8)
+            ],
+        }, rng.choice(self.users)
+
+    def send(self, client, name):
+        method, path, data, user_id = getattr(self, 'request_' + name)()
+        headers = {}
+        if user_id is not None:
+            headers['HTTP_AUTHORIZATION'] = f'Token {self.tokens[user_id]}'
+        if method == 'post':
+            response = client.post(path, json.dumps(data),
+                                   content_type='application/json',
+                                   **headers)
+        else:
+            response = client.get(path, data, **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def measure(self, client, name, requests, warmup):
+        for _ in range(warmup):
+            self.send(client, name)
+        latencies = []
+        db_times = []
+        queries = []
+        errors = 0
+        for _ in range(requests):
+            metrics = RequestMetrics()
+            with connection.execute_wrapper(metrics.execute):
+                started = time.perf_counter()
+                status = self.send(client, name)
+                latencies.append(time.perf_counter() - started)
+            db_times.append(metrics.db_time)
+            queries.append(metrics.queries)
+            errors += status >= 400
+
+        # tracemalloc замедляет выполнение, поэтому память замеряется
+        # отдельными запросами после замеров времени.
+        tracemalloc.start()
+        try:
+            for _ in range(MEMORY_ITERATIONS):
+                self.send(client, name)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        def milliseconds(values):
+            ordered = sorted(values)
+            result = {f'p{rank}': round(percentile(ordered, rank) * 1000, 3)
+                      for rank in PERCENTILES}
+            result['mean'] = round(sum(values) / len(values) * 1000, 3)
+            return result
+
+        return {
+            'requests': requests,
+            'errors': errors,
+            'latency_ms': milliseconds(latencies),
+            'db_ms': milliseconds(db_times),
+            'queries': {
+                'p50': percentile(sorted(queries), 50),
+                'max': max(queries),
+            },
+            'peak_memory_kb': round(peak / 1024),
+        }
@@ -0,0 +1,89 @@
+import posixpath
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import get_variant_name
+from recipes.models import Recipe
+
+IMAGES_DIR = 'recipes/images'
+VARIANTS_DIR = 'variants'
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки рецептов и их копии, на которые не ссылается '
+            'ни один рецепт (mark-and-sweep)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-period', type=int, default=60 * 60,
+            help='не трогать файлы моложе этого числа секунд',
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def walk(self, storage, path):
+        directories, files = storage.listdir(path)
+        for name in files:
+            yield posixpath.join(path, name)
+        for directory in directories:
+            yield from self.walk(storage, posixpath.join(path, directory))
+
+    def is_variant(self, name):
+        return posixpath.basename(posixpath.dirname(name)) == VARIANTS_DIR
+
+    def get_original_key(self, name):
+        directory, filename = posixpath.split(name)
+        stem = posixpath.splitext(filename)[0]
+        if self.is_variant(name):
+            return posixpath.dirname(directory), stem.rpartition('_')[0]
+        return directory, stem
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        if not storage.exists(IMAGES_DIR):
+            return
+
+        # Mark: оригиналы, на которые ссылаются рецепты, и их копии с
+        # текущими настройками. Копии со старыми настройками удаляются.
+        images = set(Recipe.objects.exclude(image='')
+                     .values_list('image', flat=True).iterator())
+        marked = {self.get_original_key(name) for name in images}
+        variants = {
+            get_variant_name(name, variant)
+            for name in images for variant in settings.RECIPE_IMAGE_VARIANTS
+        }
+
+        # Sweep: копия удаляется вместе с оригиналом, а свежие файлы
+        # могут принадлежать рецептам, которые ещё сохраняются.
+        deadline = time.time() - options['grace_period']
+
+        def is_stale(name):
+            return storage.get_modified_time(name).timestamp() < deadline
+
+        fresh = set()
+        candidates = []
+        for name in self.walk(storage, IMAGES_DIR):
+            key = self.get_original_key(name)
+            if name in variants or (
+                    key in marked and not self.is_variant(name)):
+                continue
+            if is_stale(name):
+                candidates.append((name, key))
+            else:
+                fresh.add(key)
+
+        removed = freed = 0
+        for name, key in candidates:
+            if key in fresh or not storage.exists(name) or not is_stale(name):
+                continue
+            freed += storage.size(name)
+            removed += 1
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                storage.delete(name)
+        self.stdout.write(self.style.SUCCESS(
+            'Удалено файлов: {}, освобождено байт: {}{}'.format(
+                removed, freed,
+                ' (пробный запуск)' if options['dry_run'] else '')))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Строит уменьшенные копии картинок рецептов, для которых они '
+            'ещё не готовы')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help=('построить недостающие копии для всех рецептов, например '
+                  'после смены RECIPE_IMAGE_VARIANTS или качества'),
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants_ready=False)
+        done = failed = 0
+        for recipe_id, name in recipes.values_list('pk', 'image').iterator():
+            if generate_variants(recipe_id, name):
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {done}, с ошибкой: {failed}'))
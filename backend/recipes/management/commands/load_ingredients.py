@@ -0,0 +1,98 @@
+import csv
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.autocomplete import ingredient_index
+from recipes.models import Ingredient
+
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(settings.BASE_DIR), 'data', 'ingredients.csv')
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    # Разбирает массив объектов по частям, не загружая файл целиком.
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: file.read(JSON_CHUNK_SIZE), ''):
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not started:
+                if not buffer:
+                    break
+                if buffer[0] != '[':
+                    raise CommandError('Ожидается JSON-массив ингредиентов')
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer[:1] in (',', ']'):
+                buffer = buffer[1:]
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except ValueError:
+                break
+            buffer = buffer[end:]
+            yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--format', choices=READERS, default=None,
+                            help='по умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = (options['format']
+                       or os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        batch_size = options['batch_size']
+
+        started = time.monotonic()
+        seen = set(Ingredient.objects.values_list('name', 'measurement_unit'))
+        read = created = 0
+        batch = []
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            for name, measurement_unit in READERS[file_format](file):
+                read += 1
+                key = (name.strip(), measurement_unit.strip())
+                if not key[0] or key in seen:
+                    continue
+                seen.add(key)
+                batch.append(Ingredient(name=key[0],
+                                        measurement_unit=key[1]))
+                if len(batch) >= batch_size:
+                    created += len(Ingredient.objects.bulk_create(batch))
+                    batch = []
+            created += len(Ingredient.objects.bulk_create(batch))
+        if created:
+            ingredient_index.bump_version()
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {read}, добавлено ингредиентов: {created} '
+            f'за {elapsed:.2f} с ({read / elapsed:.0f} строк/с)'))
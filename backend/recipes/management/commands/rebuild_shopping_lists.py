@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingCartIngredient
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводные списки покупок по корзинам пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', type=int, dest='users',
+            help='id пользователя; по умолчанию пересчитываются все',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = None
+        if options['users']:
+            users = User.objects.filter(pk__in=options['users'])
+        created = ShoppingCartIngredient.objects.rebuild(
+            users=users, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано строк списка покупок: {created}'))
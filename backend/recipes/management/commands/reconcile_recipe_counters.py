@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики избранного и списков покупок у рецептов '
+            'с фактическим числом записей и исправляет расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipe', action='append', type=int, dest='recipes',
+            help='id рецепта; по умолчанию проверяются все',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if options['recipes']:
+            recipes = recipes.filter(pk__in=options['recipes'])
+        fixed = recipes.reconcile_counters(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено рецептов: {fixed}'))
@@ -0,0 +1,51 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+SEARCH_INDEX_NAME = 'recipe_search_document_idx'
+
+
+def fill_search_documents(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    recipes = list(Recipe.objects.prefetch_related('tags',
+                                                   'amounts__ingredient'))
+    for recipe in recipes:
+        parts = [recipe.name]
+        parts.extend(tag.name for tag in recipe.tags.all())
+        parts.extend(amount.ingredient.name
+                     for amount in recipe.amounts.all())
+        parts.append(recipe.text)
+        recipe.search_document = ' '.join(parts).lower()
+    Recipe.objects.bulk_update(recipes, ['search_document'], batch_size=500)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX {SEARCH_INDEX_NAME} ON recipes_recipe '
+        "USING gin (to_tsvector('russian', search_document))"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Поисковый документ'),
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,6 +1,13 @@
-from django.db import models
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, models, transaction
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator
-from users.models import User
+from users.models import Follow, User, UserLinkManager
+
+from .storage import content_addressed_storage
 
 class Tag(models.Model):
     name = models.CharField(
@@ -41,7 +48,76 @@ class Ingredient(models.Model):
         
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
-        
+
+
+def get_recipe_prefetch_lookups():
+    return (
+        'tags',
+        models.Prefetch(
+            'amounts',
+            queryset=IngredientAmount.objects.select_related('ingredient'),
+        ),
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            *get_recipe_prefetch_lookups())
+
+    def update_search_documents(self):
+        recipes = list(self.prefetch_related(*get_recipe_prefetch_lookups()))
+        for recipe in recipes:
+            recipe.search_document = recipe.build_search_document()
+        self.model.objects.bulk_update(
+            recipes, ['search_document'], batch_size=500)
+        return len(recipes)
+
+    def change_counter(self, field, delta):
+        # Счётчик меняется выражением F, поэтому параллельные запросы не
+        # теряют обновления; значение не опускается ниже нуля.
+        queryset = self
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+        return queryset.update(**{field: models.F(field) + delta})
+
+    def with_actual_counters(self):
+        def count(model, field):
+            return Coalesce(models.Subquery(
+                model.objects
+                .filter(**{field: models.OuterRef('pk')})
+                .order_by()
+                .values(field)
+                .annotate(total=models.Count('pk'))
+                .values('total')
+            ), 0)
+
+        return self.annotate(
+            actual_favorites_count=count(FavoriteRecipe, 'favorite_recipe'),
+            actual_in_carts_count=count(ShoppingCart, 'recipe'),
+        )
+
+    def reconcile_counters(self, batch_size=500):
+        drifted = list(
+            self.with_actual_counters()
+            .exclude(favorites_count=models.F('actual_favorites_count'),
+                     in_carts_count=models.F('actual_in_carts_count'))
+            .only('pk')
+        )
+        for recipe in drifted:
+            recipe.favorites_count = recipe.actual_favorites_count
+            recipe.in_carts_count = recipe.actual_in_carts_count
+        self.model.objects.bulk_update(
+            drifted, ['favorites_count', 'in_carts_count'],
+            batch_size=batch_size)
+        return len(drifted)
+
+    def with_author(self):
+        # Теги и ингредиенты догружаются сериализатором только для
+        # рецептов, которых нет в кэше представлений.
+        return self.select_related('author')
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -68,6 +144,7 @@ class Recipe(models.Model):
     
     image = models.ImageField(
         upload_to='recipes/images',
+        storage=content_addressed_storage,
         verbose_name='Изображение')
     
     text = models.TextField(
@@ -85,13 +162,55 @@ class Recipe(models.Model):
         verbose_name='Дата публикации'
     )
 
+    image_variants_ready = models.BooleanField(
+        verbose_name='Копии изображения готовы',
+        default=False,
+        editable=False,
+    )
+
+    search_document = models.TextField(
+        verbose_name='Поисковый документ',
+        blank=True,
+        default='',
+        editable=False,
+    )
+
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в избранное',
+        default=0,
+        editable=False,
+    )
+
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в список покупок',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    def build_search_document(self):
+        parts = [self.name]
+        parts.extend(tag.name for tag in self.tags.all())
+        parts.extend(amount.ingredient.name for amount in self.amounts.all())
+        parts.append(self.text)
+        return ' '.join(parts).lower()
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ['-pub_date',]
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['-favorites_count', '-pub_date', '-id'],
+                         name='recipe_popular_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx'),
+        ]
         
 class IngredientAmount(models.Model):
     ingredient = models.ForeignKey(
@@ -118,7 +237,58 @@ class IngredientAmount(models.Model):
         verbose_name_plural = 'Количество ингредиентов'
         constraints = [models.UniqueConstraint(fields=('recipe', 'ingredient'),
                                                name='unique ingredient')]
-        
+
+
+class RecipeLinkManager(UserLinkManager):
+    """Добавление рецептов в избранное или корзину вместе со счётчиком."""
+    counter_field = None
+
+    def changed(self, user, recipe_ids, delta):
+        Recipe.objects.filter(pk__in=recipe_ids).change_counter(
+            self.counter_field, delta)
+
+    def add(self, user, recipe_ids):
+        with transaction.atomic(using=self.db):
+            added = self.link(user, recipe_ids)
+            self.changed(user, added, 1)
+        return added
+
+    def add_from(self, user, source):
+        with transaction.atomic(using=self.db):
+            added = self.link_from(user, source)
+            self.changed(user, added, 1)
+        return added
+
+    def remove(self, user, recipe_ids):
+        with transaction.atomic(using=self.db):
+            removed = self.unlink(user, recipe_ids)
+            self.changed(user, removed, -1)
+        return removed
+
+    def clear(self, user):
+        with transaction.atomic(using=self.db):
+            removed = self.unlink_all(user)
+            self.changed(user, removed, -1)
+        return removed
+
+
+class FavoriteRecipeManager(RecipeLinkManager):
+    target_field = 'favorite_recipe'
+    counter_field = 'favorites_count'
+
+
+class ShoppingCartManager(RecipeLinkManager):
+    target_field = 'recipe'
+    counter_field = 'in_carts_count'
+
+    def changed(self, user, recipe_ids, delta):
+        super().changed(user, recipe_ids, delta)
+        if delta > 0:
+            ShoppingCartIngredient.objects.add_recipes(user, recipe_ids)
+        else:
+            ShoppingCartIngredient.objects.remove_recipes(user, recipe_ids)
+
+
 class FavoriteRecipe(models.Model):
     user = models.ForeignKey(
         User,
@@ -133,6 +303,8 @@ class FavoriteRecipe(models.Model):
         verbose_name='Рецепт',
     )
 
+    objects = FavoriteRecipeManager()
+
 
     class Meta:
         verbose_name = 'Избравнный рецепт'
@@ -156,6 +328,8 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт'
     )
 
+    objects = ShoppingCartManager()
+
 
     class Meta:
         verbose_name = 'Корзина покупок'
@@ -165,3 +339,264 @@ class ShoppingCart(models.Model):
                 fields=('user', 'recipe'),
                 name='unique recipe in shopping cart')]
 
+
+class ShoppingCartIngredientManager(models.Manager):
+    def get_recipe_amounts(self, recipes):
+        return Counter(dict(
+            IngredientAmount.objects
+            .filter(recipe__in=recipes)
+            .order_by()
+            .values('ingredient_id')
+            .annotate(total=models.Sum('amount'))
+            .values_list('ingredient_id', 'total')
+        ))
+
+    @transaction.atomic
+    def apply_delta(self, user_ids, delta):
+        user_ids = sorted(set(user_ids))
+        delta = {key: value for key, value in delta.items() if value}
+        if not user_ids or not delta:
+            return
+        # Блокировка пользователей сериализует изменения одной корзины,
+        # чтобы параллельные запросы не создали одну строку дважды.
+        list(User.objects.select_for_update()
+             .filter(pk__in=user_ids).values_list('pk', flat=True))
+        rows = self.filter(user_id__in=user_ids, ingredient_id__in=delta)
+        existing = set()
+        to_update = []
+        to_delete = []
+        for row in rows:
+            existing.add((row.user_id, row.ingredient_id))
+            row.total_amount += delta[row.ingredient_id]
+            if row.total_amount > 0:
+                to_update.append(row)
+            else:
+                to_delete.append(row.pk)
+        self.bulk_update(to_update, ['total_amount'])
+        self.filter(pk__in=to_delete).delete()
+        self.bulk_create([
+            self.model(user_id=user_id, ingredient_id=ingredient_id,
+                       total_amount=amount)
+            for user_id in user_ids
+            for ingredient_id, amount in delta.items()
+            if amount > 0 and (user_id, ingredient_id) not in existing
+        ])
+
+    def add_recipes(self, user, recipe_ids):
+        if recipe_ids:
+            self.apply_delta([user.pk], self.get_recipe_amounts(recipe_ids))
+
+    def remove_recipes(self, user, recipe_ids):
+        if recipe_ids:
+            amounts = self.get_recipe_amounts(recipe_ids)
+            self.apply_delta(
+                [user.pk], {key: -value for key, value in amounts.items()})
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        delta = Counter(new_amounts)
+        delta.subtract(old_amounts)
+        user_ids = ShoppingCart.objects.filter(
+            recipe=recipe).values_list('user_id', flat=True)
+        self.apply_delta(user_ids, delta)
+
+    def delete_recipe(self, recipe):
+        self.change_recipe(recipe, self.get_recipe_amounts([recipe]), {})
+
+    @transaction.atomic
+    def rebuild(self, users=None, batch_size=1000):
+        carts = ShoppingCart.objects.all()
+        aggregates = self.all()
+        if users is not None:
+            carts = carts.filter(user__in=users)
+            aggregates = aggregates.filter(user__in=users)
+        aggregates.delete()
+        totals = (
+            carts
+            .values('user', 'recipe__amounts__ingredient')
+            .annotate(total_amount=models.Sum('recipe__amounts__amount'))
+            .values_list('user', 'recipe__amounts__ingredient',
+                         'total_amount')
+            .order_by()
+        )
+        created = 0
+        batch = []
+        for user_id, ingredient_id, total_amount in totals.iterator():
+            if ingredient_id is None:
+                continue
+            batch.append(self.model(user_id=user_id,
+                                    ingredient_id=ingredient_id,
+                                    total_amount=total_amount))
+            if len(batch) >= batch_size:
+                created += len(self.bulk_create(batch))
+                batch = []
+        created += len(self.bulk_create(batch))
+        return created
+
+
+def release_recipe_from_carts(sender, instance, **kwargs):
+    # Рецепт может удаляться каскадом вместе с автором или из админки,
+    # а корзины и ингредиенты рецепта ещё на месте до конца pre_delete.
+    ShoppingCartIngredient.objects.delete_recipe(instance)
+
+
+class ShoppingCartIngredient(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество',
+    )
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique ingredient in shopping list')]
+
+
+class FeedEntryManager(models.Manager):
+    """Лента рецептов авторов, на которых подписан пользователь.
+
+    Рецепт автора с числом подписчиков не больше FEED_FANOUT_LIMIT
+    раскладывается по лентам подписчиков при публикации. Рецепты
+    популярных авторов в ленту не пишутся, а подмешиваются при чтении.
+    """
+    PULL_AUTHORS_KEY = 'feed:pull-authors'
+
+    def get_pull_authors(self):
+        authors = cache.get(self.PULL_AUTHORS_KEY)
+        if authors is None:
+            authors = set(
+                Follow.objects
+                .values('author')
+                .annotate(followers=models.Count('pk'))
+                .filter(followers__gt=settings.FEED_FANOUT_LIMIT)
+                .values_list('author', flat=True)
+            )
+            cache.set(self.PULL_AUTHORS_KEY, authors,
+                      settings.FEED_PULL_AUTHORS_CACHE_TIMEOUT)
+        return authors
+
+    def fan_out(self, recipe):
+        if recipe.author_id in self.get_pull_authors():
+            return
+        ops = connections[self.db].ops
+        quote_name = ops.quote_name
+        follow_opts = Follow._meta
+        sql = (
+            'INSERT INTO {table} ({user}, {recipe}, {author}, {pub_date}) '
+            'SELECT {follower}, %s, %s, %s FROM {follow_table} '
+            'WHERE {followed} = %s ON CONFLICT DO NOTHING'
+        ).format(
+            table=quote_name(self.model._meta.db_table),
+            user=quote_name('user_id'),
+            recipe=quote_name('recipe_id'),
+            author=quote_name('author_id'),
+            pub_date=quote_name('pub_date'),
+            follower=quote_name(follow_opts.get_field('user').column),
+            follow_table=quote_name(follow_opts.db_table),
+            followed=quote_name(follow_opts.get_field('author').column),
+        )
+        with connections[self.db].cursor() as cursor:
+            # Дата приводится так же, как в запросах ORM, иначе SQLite
+            # сохранит её с зоной и сравнение с pub_date рецепта не сойдётся.
+            cursor.execute(sql, [
+                recipe.pk, recipe.author_id,
+                ops.adapt_datetimefield_value(recipe.pub_date),
+                recipe.author_id,
+            ])
+
+    def follow(self, user, author_id):
+        if author_id in self.get_pull_authors():
+            return
+        recipes = (
+            Recipe.objects
+            .filter(author_id=author_id)
+            .order_by('-pub_date', '-id')
+            .values_list('pk', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+        )
+        self.bulk_create([
+            self.model(user=user, recipe_id=recipe_id, author_id=author_id,
+                       pub_date=pub_date)
+            for recipe_id, pub_date in recipes
+        ], ignore_conflicts=True)
+
+    def unfollow(self, user, author_id):
+        self.filter(user=user, author_id=author_id).delete()
+
+    def get_page(self, user, position, limit):
+        """Ключи (pub_date, id) рецептов ленты после позиции position."""
+        def after(queryset, recipe_field):
+            if position is None:
+                return queryset
+            pub_date, recipe_id = position
+            return queryset.filter(
+                models.Q(pub_date__lt=pub_date)
+                | models.Q(pub_date=pub_date,
+                           **{f'{recipe_field}__lt': recipe_id}))
+
+        pushed = after(self.filter(user=user), 'recipe_id').order_by(
+            '-pub_date', '-recipe_id').values_list('pub_date', 'recipe_id')
+        keys = set(pushed[:limit])
+        pull_authors = self.get_pull_authors()
+        if pull_authors:
+            authors = Follow.objects.filter(
+                user=user, author__in=pull_authors).values('author')
+            pulled = after(Recipe.objects.filter(author__in=authors),
+                           'id').order_by('-pub_date', '-id').values_list(
+                               'pub_date', 'id')
+            keys.update(pulled[:limit])
+        return sorted(keys, reverse=True)[:limit]
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique recipe in feed')]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
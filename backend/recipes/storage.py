@@ -0,0 +1,43 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла - SHA-256 его содержимого.
+
+    Одинаковые картинки сохраняются один раз, а файл по имени никогда не
+    меняется, поэтому его можно кэшировать навсегда. Файлы не удаляются
+    при смене картинки рецепта: на них могут ссылаться другие рецепты,
+    неиспользуемые файлы удаляет команда cleanup_media.
+    """
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            # Новая ссылка на старый файл: обновляем время изменения,
+            # чтобы cleanup_media не удалил его как давно забытый.
+            os.utime(self.path(name))
+            return name
+        return self._save(name, content)
+
+
+content_addressed_storage = ContentAddressedStorage()
@@ -0,0 +1,145 @@
+import base64
+import io
+
+import pytest
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientAmount,
+                            Recipe, ShoppingCart, Tag)
+from rest_framework.test import APIClient
+from users.models import User
+
+
+def make_png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 40), 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+PNG = make_png()
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(settings, tmp_path):
+    # Версии и снимки в кэше ссылаются на id, которые после отката
+    # транзакции теста достанутся другим объектам.
+    settings.MEDIA_ROOT = str(tmp_path)
+    for alias in settings.CACHES:
+        caches[alias].clear()
+    yield
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(
+        username='author', email='author@example.org', password='pass',
+        first_name='Иван', last_name='Петров')
+
+
+@pytest.fixture
+def other_user(db):
+    return User.objects.create_user(
+        username='reader', email='reader@example.org', password='pass',
+        first_name='Анна', last_name='Сидорова')
+
+
+@pytest.fixture
+def client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def other_client(other_user):
+    client = APIClient()
+    client.force_authenticate(other_user)
+    return client
+
+
+@pytest.fixture
+def anon_client():
+    return APIClient()
+
+
+@pytest.fixture
+def tags(db):
+    return [
+        Tag.objects.create(name=name, color=color, slug=slug)
+        for name, color, slug in (
+            ('Завтрак', '#E26C2D', 'breakfast'),
+            ('Обед', '#49B64E', 'lunch'),
+            ('Ужин', '#8775D2', 'dinner'),
+        )
+    ]
+
+
+@pytest.fixture
+def ingredients(db):
+    return [
+        Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in ('картофель', 'морковь', 'лук', 'свёкла', 'капуста',
+                     'сметана')
+    ]
+
+
+@pytest.fixture
+def make_recipe(user, tags, ingredients):
+    def make_recipe(name='Борщ', author=None, recipe_tags=None,
+                    amounts=None):
+        recipe = Recipe.objects.create(
+            author=author or user, name=name, text='Описание',
+            cooking_time=30,
+            image=SimpleUploadedFile('recipe.png', PNG, 'image/png'))
+        recipe.tags.set(recipe_tags or tags[:2])
+        if amounts is None:
+            amounts = {ingredients[0]: 100, ingredients[1]: 50}
+        for ingredient, amount in amounts.items():
+            IngredientAmount.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=amount)
+        return recipe
+    return make_recipe
+
+
+@pytest.fixture
+def recipe_data(tags, ingredients):
+    return {
+        'name': 'Щи',
+        'text': 'Сварить',
+        'cooking_time': 40,
+        'image': 'data:image/png;base64,' + base64.b64encode(PNG).decode(),
+        'tags': [tags[0].id],
+        'ingredients': [
+            {'id': ingredients[0].id, 'amount': 200},
+            {'id': ingredients[4].id, 'amount': 300},
+        ],
+    }
+
+
+@pytest.fixture
+def count_queries():
+    def count_queries(request, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = request(*args, **kwargs)
+        return response, len(context.captured_queries)
+    return count_queries
+
+
+@pytest.fixture
+def catalogue(make_recipe, client, user, other_user, ingredients):
+    recipes = [
+        make_recipe(name=f'Рецепт {number}',
+                    author=user if number % 2 else other_user,
+                    amounts={ingredients[number % 6]: 10,
+                             ingredients[(number + 1) % 6]: 20})
+        for number in range(24)
+    ]
+    client.post(f'/api/users/{other_user.pk}/subscribe/')
+    FavoriteRecipe.objects.add(user, [recipe.pk for recipe in recipes[::3]])
+    ShoppingCart.objects.add(user, [recipe.pk for recipe in recipes[::4]])
+    return recipes
@@ -0,0 +1,42 @@
+import pytest
+from django.core.cache import caches
+
+# Версии справочников меняются в transaction.on_commit, поэтому тестам
+# нужны настоящие транзакции.
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def test_catalogue_etag(anon_client, tags):
+    response = anon_client.get('/api/tags/')
+    etag = response['ETag']
+    assert anon_client.get(
+        '/api/tags/', HTTP_IF_NONE_MATCH=etag).status_code == 304
+    tags[0].name = 'Бранч'
+    tags[0].save()
+    response = anon_client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert 'Бранч' in [tag['name'] for tag in response.json()]
+
+
+def test_ingredient_search_is_not_cached(anon_client, ingredients):
+    cache_keys = caches['default']._cache
+    anon_client.get('/api/ingredients/')
+    stored = set(cache_keys)
+    for prefix in ('к', 'ка', 'кар'):
+        response = anon_client.get('/api/ingredients/', {'name': prefix})
+        assert response.status_code == 200
+    assert set(cache_keys) == stored
+    assert [item['name'] for item in response.json()] == ['картофель']
+
+
+def test_ingredient_search_etag(anon_client, ingredients):
+    url = '/api/ingredients/?name=кар'
+    etag = anon_client.get(url)['ETag']
+    assert anon_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    assert anon_client.get('/api/ingredients/?name=мор',
+                           HTTP_IF_NONE_MATCH=etag).status_code == 200
+    ingredients[0].name = 'карп'
+    ingredients[0].save()
+    response = anon_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert [item['name'] for item in response.json()] == ['карп']
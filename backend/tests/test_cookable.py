@@ -0,0 +1,86 @@
+import pytest
+from api.cookable import cookable_index
+
+
+def cookable(client, *ingredients, query=''):
+    response = client.get('/api/recipes/cookable/?ingredients={}{}'.format(
+        ','.join(str(ingredient.pk) for ingredient in ingredients), query))
+    assert response.status_code == 200
+    return {item['id']: item['coverage']
+            for item in response.json()['results']}
+
+
+def test_cookable_ranks_by_coverage(anon_client, make_recipe, ingredients):
+    full = make_recipe(amounts={ingredients[0]: 1, ingredients[1]: 1})
+    half = make_recipe(amounts={ingredients[0]: 1, ingredients[2]: 1})
+    third = make_recipe(amounts={ingredients[1]: 1, ingredients[3]: 1,
+                                 ingredients[4]: 1})
+    response = anon_client.get(
+        '/api/recipes/cookable/?ingredients={},{}'.format(
+            ingredients[0].pk, ingredients[1].pk))
+    assert [item['id'] for item in response.json()['results']] == [
+        full.pk, half.pk, third.pk]
+    assert cookable(anon_client, ingredients[0], ingredients[1],
+                    query='&min_coverage=0.5') == {full.pk: 1.0,
+                                                   half.pk: 0.5}
+
+
+def test_cookable_pages_ranked_ids(anon_client, make_recipe, ingredients,
+                                   tags, count_queries):
+    recipes = [
+        make_recipe(name=f'Рецепт {number}', recipe_tags=[tags[number % 2]],
+                    amounts={ingredients[0]: 1, ingredients[1]: 1})
+        for number in range(12)
+    ]
+    url = f'/api/recipes/cookable/?ingredients={ingredients[0].pk}&limit=5'
+    data = anon_client.get(url).json()
+    assert data['count'] == len(recipes)
+    assert [item['id'] for item in data['results']] == sorted(
+        (recipe.pk for recipe in recipes), reverse=True)[:5]
+    # Индекс уже построен: из базы читаются только рецепты страницы и
+    # их теги и ингредиенты для представлений.
+    response, queries = count_queries(anon_client.get, url + '&page=3')
+    assert len(response.json()['results']) == 2
+    assert response.json()['next'] is None
+    assert queries == 3
+
+    assert set(cookable(anon_client, ingredients[0],
+                        query=f'&tags={tags[0].slug}&limit=20')) == {
+        recipe.pk for recipe in recipes[::2]}
+
+
+@pytest.mark.parametrize('query', ['', '?ingredients=abc',
+                                   '?ingredients=1&min_coverage=x'])
+def test_cookable_rejects_bad_parameters(anon_client, query):
+    response = anon_client.get('/api/recipes/cookable/' + query)
+    assert response.status_code == 400
+
+
+# Изменения публикуются для других процессов после коммита.
+@pytest.mark.django_db(transaction=True)
+def test_cookable_index_is_updated_incrementally(client, make_recipe,
+                                                 ingredients,
+                                                 monkeypatch):
+    first = make_recipe(amounts={ingredients[0]: 1, ingredients[1]: 1})
+    second = make_recipe(amounts={ingredients[0]: 1, ingredients[2]: 1})
+    assert cookable(client, ingredients[0], ingredients[1]) == {
+        first.pk: 1.0, second.pk: 0.5}
+
+    builds = []
+    build = cookable_index.build
+    monkeypatch.setattr(cookable_index, 'build',
+                        lambda *args: builds.append(args) or build(*args))
+    client.patch(f'/api/recipes/{second.pk}/', {'ingredients': [
+        {'id': ingredients[1].id, 'amount': 1},
+    ]}, format='json')
+    assert cookable(client, ingredients[1]) == {
+        first.pk: 0.5, second.pk: 1.0}
+    client.delete(f'/api/recipes/{first.pk}/')
+    assert cookable(client, ingredients[0], ingredients[1]) == {
+        second.pk: 1.0}
+    assert builds == []
+
+    data = cookable_index.get_data()
+    rebuilt = build(data.version, data.sequence)
+    assert rebuilt.postings == data.postings
+    assert rebuilt.ingredients == data.ingredients
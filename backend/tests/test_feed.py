@@ -0,0 +1,60 @@
+from django.core.cache import cache
+from django.utils import timezone
+from recipes.models import FeedEntry, Recipe
+
+
+def walk(client, url):
+    ids = []
+    while url:
+        data = client.get(url).json()
+        ids.extend(item['id'] for item in data['results'])
+        url = data['next']
+        assert len(ids) <= 100, 'курсор не продвигается'
+    return ids
+
+
+def test_feed_query_count_does_not_depend_on_page_size(
+        client, catalogue, count_queries):
+    counts = []
+    for limit in (2, 10):
+        cache.clear()
+        response, queries = count_queries(
+            client.get, f'/api/recipes/feed/?limit={limit}')
+        assert response.status_code == 200
+        assert len(response.json()['results']) == limit
+        counts.append(queries)
+    assert counts[0] == counts[1]
+
+
+def test_feed_backfills_on_subscribe(client, other_user, make_recipe):
+    recipes = [make_recipe(name=f'Лента {number}', author=other_user)
+               for number in range(7)]
+    Recipe.objects.update(pub_date=timezone.now())
+    client.post(f'/api/users/{other_user.pk}/subscribe/')
+    ids = walk(client, '/api/recipes/feed/?limit=3')
+    assert ids == sorted((recipe.pk for recipe in recipes), reverse=True)
+
+
+def test_fan_out_pages_equal_dates(client, other_client, user, recipe_data,
+                                   monkeypatch):
+    other_client.post(f'/api/users/{user.pk}/subscribe/')
+    moment = timezone.now()
+    monkeypatch.setattr(timezone, 'now', lambda: moment)
+    ids = [client.post('/api/recipes/', recipe_data, format='json')
+           .json()['id'] for _ in range(5)]
+    assert FeedEntry.objects.filter(pub_date=moment).count() == len(ids)
+    assert walk(other_client, '/api/recipes/feed/?limit=2') == sorted(
+        ids, reverse=True)
+
+
+def test_feed_follows_unsubscribe(client, other_user, make_recipe):
+    make_recipe(author=other_user)
+    url = f'/api/users/{other_user.pk}/subscribe/'
+    client.post(url)
+    assert walk(client, '/api/recipes/feed/')
+    client.delete(url)
+    assert walk(client, '/api/recipes/feed/') == []
+
+
+def test_feed_requires_authentication(anon_client):
+    assert anon_client.get('/api/recipes/feed/').status_code == 401
@@ -0,0 +1,28 @@
+import pytest
+from api.instrumentation import BudgetExceeded, registry
+
+DOWNLOAD = ('api:recipes-download-shopping-cart', 'GET')
+
+
+def get_queries(key):
+    samples = registry.samples.get(key, ())
+    return [sample['queries'] for sample in samples]
+
+
+def test_streaming_response_is_measured_until_read(client, make_recipe):
+    recipe = make_recipe()
+    client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+    before = len(get_queries(DOWNLOAD))
+    response = client.get('/api/recipes/download_shopping_cart/')
+    assert len(get_queries(DOWNLOAD)) == before
+    b''.join(response.streaming_content)
+    queries = get_queries(DOWNLOAD)
+    assert len(queries) == before + 1
+    assert queries[-1] >= 1
+
+
+def test_budget_is_strict_under_pytest(client, settings):
+    settings.INSTRUMENTATION_BUDGETS = {
+        'GET api:tags-list': {'queries': 0}}
+    with pytest.raises(BudgetExceeded):
+        client.get('/api/tags/')
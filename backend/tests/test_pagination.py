@@ -0,0 +1,75 @@
+import pytest
+from django.utils import timezone
+from recipes.models import Recipe
+
+
+@pytest.fixture
+def same_day_recipes(make_recipe, ingredients):
+    recipes = [
+        make_recipe(name=f'Рецепт {number}',
+                    amounts={ingredients[number % 6]: 10})
+        for number in range(15)
+    ]
+    # Одинаковые даты и счётчики: порядок задаёт только id.
+    Recipe.objects.update(pub_date=timezone.now())
+    for number, recipe in enumerate(recipes):
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=number % 2)
+    return recipes
+
+
+def walk(client, url):
+    ids = []
+    pages = 0
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        data = response.json()
+        assert set(data) == {'next', 'results'}
+        ids.extend(item['id'] for item in data['results'])
+        url = data['next']
+        pages += 1
+        assert pages <= 20, 'курсор не продвигается'
+    return ids
+
+
+@pytest.mark.parametrize('query, ordering', [
+    ('', ('-pub_date', '-id')),
+    ('&ordering=popular', ('-favorites_count', '-pub_date', '-id')),
+])
+def test_cursor_walks_every_recipe_once(anon_client, same_day_recipes,
+                                        query, ordering):
+    ids = walk(anon_client, '/api/recipes/?cursor=&limit=4' + query)
+    assert ids == list(
+        Recipe.objects.order_by(*ordering).values_list('pk', flat=True))
+
+
+def test_cursor_respects_filters(anon_client, same_day_recipes, tags):
+    ids = walk(anon_client,
+               f'/api/recipes/?cursor=&limit=4&tags={tags[0].slug}')
+    assert len(ids) == len(same_day_recipes)
+    assert walk(anon_client,
+                f'/api/recipes/?cursor=&limit=4&tags={tags[2].slug}') == []
+
+
+def test_invalid_cursor(anon_client, same_day_recipes):
+    response = anon_client.get('/api/recipes/?cursor=zzz')
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize('url', [
+    '/api/recipes/?cursor=&search=Рецепт',
+    '/api/recipes/cookable/?cursor=&ingredients=1',
+])
+def test_cursor_rejected_with_relevance_ordering(anon_client,
+                                                 same_day_recipes, url):
+    response = anon_client.get(url)
+    assert response.status_code == 400
+    assert 'cursor' in response.json()
+
+
+def test_page_number_pagination(anon_client, same_day_recipes):
+    data = anon_client.get('/api/recipes/?page=2&limit=4').json()
+    assert data['count'] == len(same_day_recipes)
+    assert len(data['results']) == 4
+    assert data['previous'] is not None
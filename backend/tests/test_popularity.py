@@ -0,0 +1,34 @@
+from django.core.management import call_command
+from recipes.models import Recipe
+
+
+def test_favorite_counter(client, other_client, make_recipe):
+    recipe = make_recipe()
+    client.post(f'/api/recipes/{recipe.pk}/favorite/')
+    other_client.post(f'/api/recipes/{recipe.pk}/favorite/')
+    client.post(f'/api/recipes/{recipe.pk}/favorite/')
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 2
+    client.delete(f'/api/recipes/{recipe.pk}/favorite/')
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 1
+
+
+def test_popular_ordering(anon_client, client, other_client, make_recipe):
+    recipes = [make_recipe(name=f'Рецепт {number}') for number in range(3)]
+    client.post(f'/api/recipes/{recipes[0].pk}/favorite/')
+    other_client.post(f'/api/recipes/{recipes[0].pk}/favorite/')
+    client.post(f'/api/recipes/{recipes[1].pk}/favorite/')
+    response = anon_client.get('/api/recipes/?ordering=popular')
+    assert [item['id'] for item in response.json()['results']] == [
+        recipes[0].pk, recipes[1].pk, recipes[2].pk]
+
+
+def test_reconcile_recipe_counters(client, make_recipe):
+    recipe = make_recipe()
+    client.post(f'/api/recipes/{recipe.pk}/favorite/')
+    client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+    Recipe.objects.update(favorites_count=7, in_carts_count=0)
+    call_command('reconcile_recipe_counters', verbosity=0)
+    recipe.refresh_from_db()
+    assert (recipe.favorites_count, recipe.in_carts_count) == (1, 1)
@@ -0,0 +1,72 @@
+import pytest
+from django.conf import settings
+from django.core.cache import cache
+
+
+def get_budget(key):
+    return settings.INSTRUMENTATION_BUDGETS[key]['queries']
+
+
+@pytest.mark.parametrize('url', [
+    '/api/recipes/?limit={}',
+    '/api/recipes/?cursor=&limit={}',
+    '/api/recipes/?ordering=popular&limit={}',
+    '/api/recipes/?ordering=popular&cursor=&limit={}',
+])
+def test_recipe_list_query_count_does_not_depend_on_page_size(
+        client, catalogue, count_queries, url):
+    counts = []
+    for limit in (2, 20):
+        cache.clear()
+        response, queries = count_queries(client.get, url.format(limit))
+        assert response.status_code == 200
+        assert len(response.json()['results']) == limit
+        counts.append(queries)
+    assert counts[0] == counts[1]
+    assert counts[1] <= get_budget('GET api:recipes-list')
+
+
+def test_recipe_list_is_personalized(client, catalogue):
+    results = {
+        item['id']: item
+        for item in client.get('/api/recipes/?limit=24').json()['results']
+    }
+    recipe = catalogue[0]
+    assert results[recipe.pk]['is_favorited'] is True
+    assert results[recipe.pk]['is_in_shopping_cart'] is True
+    assert results[recipe.pk]['author']['is_subscribed'] is True
+    assert results[catalogue[1].pk]['is_favorited'] is False
+
+
+def test_recipe_detail_within_budget(client, catalogue, count_queries):
+    response, queries = count_queries(
+        client.get, f'/api/recipes/{catalogue[0].pk}/')
+    assert response.status_code == 200
+    assert queries <= get_budget('GET api:recipes-detail')
+
+
+def test_recipe_patch_within_budget(client, make_recipe, tags, ingredients,
+                                    count_queries):
+    recipe = make_recipe(amounts={
+        ingredient: 10 for ingredient in ingredients[:5]})
+    response, queries = count_queries(
+        client.patch, f'/api/recipes/{recipe.pk}/', {
+            'name': 'Щи',
+            'text': 'Новое описание',
+            'cooking_time': 15,
+            'tags': [tags[2].id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 5}
+                for ingredient in ingredients[1:6]
+            ],
+        }, format='json')
+    assert response.status_code == 200
+    assert queries <= get_budget('PATCH api:recipes-detail')
+
+
+def test_recipe_delete_within_budget(client, make_recipe, count_queries):
+    recipe = make_recipe()
+    response, queries = count_queries(
+        client.delete, f'/api/recipes/{recipe.pk}/')
+    assert response.status_code == 204
+    assert queries <= get_budget('*')
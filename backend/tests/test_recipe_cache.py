@@ -0,0 +1,67 @@
+import pytest
+from recipes.models import IngredientAmount
+
+# Версии кэша меняются в transaction.on_commit, поэтому тестам нужны
+# настоящие транзакции.
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def get_recipe(client, recipe):
+    response = client.get(f'/api/recipes/{recipe.pk}/')
+    assert response.status_code == 200
+    return response.json()
+
+
+def get_ingredient_names(data):
+    return sorted(item['name'] for item in data['ingredients'])
+
+
+def test_recipe_cache_follows_api_edit(client, make_recipe):
+    recipe = make_recipe()
+    assert get_recipe(client, recipe)['name'] == 'Борщ'
+    client.patch(f'/api/recipes/{recipe.pk}/', {'name': 'Щи'},
+                 format='json')
+    assert get_recipe(client, recipe)['name'] == 'Щи'
+
+
+def test_recipe_cache_follows_amount_changes(client, make_recipe,
+                                             ingredients):
+    recipe = make_recipe()
+    assert get_ingredient_names(get_recipe(client, recipe)) == [
+        'картофель', 'морковь']
+    IngredientAmount.objects.create(
+        recipe=recipe, ingredient=ingredients[2], amount=1)
+    assert get_ingredient_names(get_recipe(client, recipe)) == [
+        'картофель', 'лук', 'морковь']
+    IngredientAmount.objects.filter(
+        recipe=recipe, ingredient=ingredients[0]).delete()
+    assert get_ingredient_names(get_recipe(client, recipe)) == [
+        'лук', 'морковь']
+
+
+def test_recipe_cache_follows_tags(client, make_recipe, tags):
+    recipe = make_recipe()
+    get_recipe(client, recipe)
+    tags[0].name = 'Поздний завтрак'
+    tags[0].save()
+    assert 'Поздний завтрак' in [
+        tag['name'] for tag in get_recipe(client, recipe)['tags']]
+    recipe.tags.set([tags[2]])
+    assert [tag['id'] for tag in get_recipe(client, recipe)['tags']] == [
+        tags[2].id]
+
+
+def test_recipe_cache_follows_author(client, user, make_recipe):
+    recipe = make_recipe()
+    get_recipe(client, recipe)
+    user.first_name = 'Пётр'
+    user.save()
+    assert get_recipe(client, recipe)['author']['first_name'] == 'Пётр'
+
+
+def test_recipe_cache_keeps_user_fields_personal(client, other_client,
+                                                 make_recipe):
+    recipe = make_recipe()
+    client.post(f'/api/recipes/{recipe.pk}/favorite/')
+    assert get_recipe(client, recipe)['is_favorited'] is True
+    assert get_recipe(other_client, recipe)['is_favorited'] is False
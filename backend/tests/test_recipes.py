@@ -0,0 +1,68 @@
+import io
+
+import pytest
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from recipes.images import generate_variants, get_variant_name
+from recipes.models import Recipe
+
+
+def test_create_recipe(client, recipe_data):
+    response = client.post('/api/recipes/', recipe_data, format='json')
+    assert response.status_code == 201
+    recipe = Recipe.objects.get(pk=response.json()['id'])
+    assert list(recipe.tags.values_list('pk', flat=True)) == (
+        recipe_data['tags'])
+    assert recipe.amounts.count() == 2
+
+
+@pytest.mark.parametrize('field, value', [
+    ('tags', []),
+    ('tags', [999999]),
+    ('ingredients', [{'id': 999999, 'amount': 1}]),
+    ('cooking_time', 0),
+])
+def test_create_recipe_rejects_invalid_data(client, recipe_data, field,
+                                            value):
+    recipe_data[field] = value
+    response = client.post('/api/recipes/', recipe_data, format='json')
+    assert response.status_code == 400
+    assert field in response.json()
+    assert not Recipe.objects.exists()
+
+
+def test_patch_rejects_empty_tags(client, make_recipe):
+    recipe = make_recipe()
+    response = client.patch(f'/api/recipes/{recipe.pk}/', {'tags': []},
+                            format='json')
+    assert response.status_code == 400
+    assert recipe.tags.count() == 2
+
+
+def test_only_author_can_edit(other_client, make_recipe):
+    recipe = make_recipe()
+    response = other_client.patch(f'/api/recipes/{recipe.pk}/',
+                                  {'name': 'Чужой'}, format='json')
+    assert response.status_code == 403
+
+
+def test_image_variants_get_new_names_with_new_settings(make_recipe,
+                                                        settings):
+    recipe = make_recipe()
+    name = recipe.image.name
+    assert generate_variants(recipe.pk, name)
+    old = {variant: get_variant_name(name, variant)
+           for variant in settings.RECIPE_IMAGE_VARIANTS}
+    settings.RECIPE_IMAGE_QUALITY = 50
+    assert generate_variants(recipe.pk, name)
+    for variant, old_name in old.items():
+        new_name = get_variant_name(name, variant)
+        assert new_name != old_name
+        assert default_storage.exists(new_name)
+        assert default_storage.exists(old_name)
+
+    call_command('cleanup_media', grace_period=0, stdout=io.StringIO())
+    assert default_storage.exists(name)
+    for variant, old_name in old.items():
+        assert default_storage.exists(get_variant_name(name, variant))
+        assert not default_storage.exists(old_name)
@@ -0,0 +1,29 @@
+import pytest
+
+
+def search(client, query):
+    response = client.get(f'/api/recipes/?search={query}')
+    assert response.status_code == 200
+    return [item['id'] for item in response.json()['results']]
+
+
+def test_search_matches_name_tags_and_ingredients(anon_client, make_recipe,
+                                                  tags, ingredients):
+    recipe = make_recipe()
+    make_recipe(name='Салат', recipe_tags=[tags[2]],
+                amounts={ingredients[4]: 1})
+    assert search(anon_client, 'борщ') == [recipe.pk]
+    assert search(anon_client, 'морковь') == [recipe.pk]
+    assert search(anon_client, 'обед') == [recipe.pk]
+    assert search(anon_client, 'пельмени') == []
+
+
+# Индекс в памяти процесса перестраивается после коммита.
+@pytest.mark.django_db(transaction=True)
+def test_search_follows_edits(anon_client, client, make_recipe):
+    recipe = make_recipe()
+    assert search(anon_client, 'борщ') == [recipe.pk]
+    client.patch(f'/api/recipes/{recipe.pk}/', {'name': 'Солянка'},
+                 format='json')
+    assert search(anon_client, 'борщ') == []
+    assert search(anon_client, 'солянка') == [recipe.pk]
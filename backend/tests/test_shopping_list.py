@@ -0,0 +1,56 @@
+from django.core.management import call_command
+from recipes.models import ShoppingCartIngredient
+
+
+def get_totals(user):
+    return dict(ShoppingCartIngredient.objects.filter(user=user)
+                .values_list('ingredient__name', 'total_amount'))
+
+
+def test_shopping_list_totals(client, user, make_recipe, ingredients):
+    first = make_recipe(amounts={ingredients[0]: 100, ingredients[1]: 50})
+    second = make_recipe(amounts={ingredients[0]: 30, ingredients[2]: 10})
+    client.post(f'/api/recipes/{first.pk}/shopping_cart/')
+    client.post(f'/api/recipes/{second.pk}/shopping_cart/')
+    assert get_totals(user) == {'картофель': 130, 'морковь': 50, 'лук': 10}
+
+    client.patch(f'/api/recipes/{second.pk}/', {'ingredients': [
+        {'id': ingredients[0].id, 'amount': 70},
+        {'id': ingredients[3].id, 'amount': 5},
+    ]}, format='json')
+    assert get_totals(user) == {
+        'картофель': 170, 'морковь': 50, 'свёкла': 5}
+
+    client.delete(f'/api/recipes/{first.pk}/shopping_cart/')
+    assert get_totals(user) == {'картофель': 70, 'свёкла': 5}
+
+    response = client.get('/api/recipes/download_shopping_cart/')
+    assert response.status_code == 200
+    content = b''.join(response.streaming_content).decode()
+    assert 'картофель' in content and '70' in content
+
+
+def test_shopping_list_totals_follow_recipe_deletion(
+        client, other_client, user, other_user, make_recipe, ingredients):
+    recipe = make_recipe(amounts={ingredients[0]: 100})
+    kept = make_recipe(author=other_user, amounts={ingredients[0]: 1})
+    client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+    client.post(f'/api/recipes/{kept.pk}/shopping_cart/')
+    other_client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+
+    assert client.delete(f'/api/recipes/{recipe.pk}/').status_code == 204
+    assert get_totals(user) == {'картофель': 1}
+    assert get_totals(other_user) == {}
+
+    # Удаление мимо API, например из админки.
+    kept.delete()
+    assert get_totals(user) == {}
+
+
+def test_rebuild_shopping_lists_repairs_drift(client, user, make_recipe,
+                                              ingredients):
+    recipe = make_recipe(amounts={ingredients[0]: 100})
+    client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+    ShoppingCartIngredient.objects.filter(user=user).update(total_amount=1)
+    call_command('rebuild_shopping_lists', verbosity=0)
+    assert get_totals(user) == {'картофель': 100}
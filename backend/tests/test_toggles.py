@@ -0,0 +1,48 @@
+import pytest
+from recipes.models import FavoriteRecipe, ShoppingCart
+from users.models import Follow
+
+
+@pytest.mark.parametrize('action, model', [
+    ('favorite', FavoriteRecipe),
+    ('shopping_cart', ShoppingCart),
+])
+def test_toggle_is_idempotent(client, user, make_recipe, action, model):
+    recipe = make_recipe()
+    url = f'/api/recipes/{recipe.pk}/{action}/'
+    assert client.post(url).status_code == 201
+    assert client.post(url).status_code == 400
+    assert model.objects.filter(user=user).count() == 1
+    assert client.delete(url).status_code == 204
+    assert client.delete(url).status_code == 400
+    assert not model.objects.filter(user=user).exists()
+    assert client.post(
+        f'/api/recipes/999999/{action}/').status_code == 404
+
+
+def test_batch_toggle(client, user, make_recipe):
+    recipes = [make_recipe(name=f'Рецепт {number}') for number in range(3)]
+    ids = [recipe.pk for recipe in recipes]
+    response = client.post('/api/recipes/favorite/', {'recipes': ids},
+                           format='json')
+    assert response.status_code == 201
+    assert sorted(response.json()['recipes']) == sorted(ids)
+    response = client.post('/api/recipes/favorite/',
+                           {'recipes': ids + [999999]}, format='json')
+    assert response.status_code == 400
+    assert FavoriteRecipe.objects.filter(user=user).count() == 3
+    response = client.delete('/api/recipes/favorite/', {'recipes': ids},
+                             format='json')
+    assert response.status_code == 204
+    assert not FavoriteRecipe.objects.filter(user=user).exists()
+
+
+def test_subscribe_is_idempotent(client, user, other_user):
+    url = f'/api/users/{other_user.pk}/subscribe/'
+    assert client.post(url).status_code == 201
+    assert client.post(url).status_code == 400
+    assert Follow.objects.filter(user=user).count() == 1
+    assert client.delete(url).status_code == 204
+    assert client.delete(url).status_code == 400
+    assert client.post(f'/api/users/{user.pk}/subscribe/').status_code == 400
+    assert client.post('/api/users/999999/subscribe/').status_code == 404
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connections, models
 from django.contrib.auth.models import AbstractUser
 
 class User(AbstractUser):
@@ -31,6 +31,84 @@ class User(AbstractUser):
         return f'{self.username}'
     
 
+class UserLinkManager(models.Manager):
+    """Связи пользователя с объектами: подписки, избранное, корзина.
+
+    Связь добавляется и удаляется одним запросом. INSERT ... ON CONFLICT
+    DO NOTHING и DELETE ... RETURNING возвращают id объектов, которые
+    действительно изменились, поэтому повторный запрос не падает с
+    ошибкой целостности, а пропускается.
+    """
+    target_field = None
+
+    def execute(self, sql, params):
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_sql_parts(self, target_ids):
+        quote_name = connections[self.db].ops.quote_name
+        opts = self.model._meta
+        target = opts.get_field(self.target_field)
+        target_opts = target.related_model._meta
+        return {
+            'table': quote_name(opts.db_table),
+            'user': quote_name(opts.get_field('user').column),
+            'target': quote_name(target.column),
+            'target_table': quote_name(target_opts.db_table),
+            'target_pk': quote_name(target_opts.pk.column),
+            'ids': ', '.join(['%s'] * len(target_ids)),
+        }
+
+    def link(self, user, target_ids):
+        target_ids = sorted(set(target_ids))
+        if not target_ids:
+            return []
+        # Строки берутся из таблицы объектов, поэтому несуществующие id
+        # не вставляются и не попадают в результат.
+        sql = (
+            'INSERT INTO {table} ({user}, {target}) '
+            'SELECT %s, {target_pk} FROM {target_table} '
+            'WHERE {target_pk} IN ({ids}) '
+            'ON CONFLICT DO NOTHING RETURNING {target}'
+        ).format(**self.get_sql_parts(target_ids))
+        return self.execute(sql, [user.pk, *target_ids])
+
+    def unlink(self, user, target_ids):
+        target_ids = sorted(set(target_ids))
+        if not target_ids:
+            return []
+        sql = (
+            'DELETE FROM {table} WHERE {user} = %s AND {target} IN ({ids}) '
+            'RETURNING {target}'
+        ).format(**self.get_sql_parts(target_ids))
+        return self.execute(sql, [user.pk, *target_ids])
+
+    def link_from(self, user, source):
+        """Копирует связи пользователя из другой таблицы связей."""
+        source_parts = source.get_sql_parts([])
+        sql = (
+            'INSERT INTO {table} ({user}, {target}) '
+            'SELECT {source_user}, {source_target} FROM {source_table} '
+            'WHERE {source_user} = %s '
+            'ON CONFLICT DO NOTHING RETURNING {target}'
+        ).format(source_table=source_parts['table'],
+                 source_user=source_parts['user'],
+                 source_target=source_parts['target'],
+                 **self.get_sql_parts([]))
+        return self.execute(sql, [user.pk])
+
+    def unlink_all(self, user):
+        sql = (
+            'DELETE FROM {table} WHERE {user} = %s RETURNING {target}'
+        ).format(**self.get_sql_parts([]))
+        return self.execute(sql, [user.pk])
+
+
+class FollowManager(UserLinkManager):
+    target_field = 'author'
+
+
 class Follow(models.Model):
     user = models.ForeignKey(
         User,
@@ -43,6 +121,8 @@ class Follow(models.Model):
         related_name='following',
         verbose_name='Автор')
 
+    objects = FollowManager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
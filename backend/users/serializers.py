@@ -3,6 +3,8 @@ from django.contrib.auth.hashers import check_password
 from djoser.serializers import (PasswordSerializer, UserCreateSerializer,
                                 UserSerializer)
 
+from api.fields import ImageVariantsField
+from api.relations import get_user_relations
 from recipes.models import Recipe
 from .models import Follow
 from rest_framework import serializers
@@ -24,10 +26,8 @@ class UserListSerializer(UserSerializer):
                   )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, author=obj.id).exists()
+        relations = get_user_relations(self.context.get('request'))
+        return obj.id in relations.following
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -59,9 +59,11 @@ class SetPasswordSerializer(PasswordSerializer):
         return data
     
 class SubscribeRecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 class FollowSerializer(serializers.ModelSerializer):
     email = serializers.CharField(
@@ -81,8 +83,7 @@ class FollowSerializer(serializers.ModelSerializer):
         read_only=True)
     recipes = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(
-        source='author.recipe.count')
+    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Follow
@@ -101,16 +102,18 @@ class FollowSerializer(serializers.ModelSerializer):
         return data
 
     def get_recipes(self, obj):
-        recipes = obj.author.recipe.all()
+        recipes = getattr(obj.author, 'limited_recipes', None)
+        if recipes is None:
+            recipes = obj.author.recipe.all()
         return SubscribeRecipeSerializer(
             recipes,
             many=True).data
 
     def get_is_subscribed(self, obj):
-        subscribe = Follow.objects.filter(
-            user=self.context.get('request').user,
-            author=obj.author
-        )
-        if subscribe:
-            return True
-        return False
\ No newline at end of file
+        relations = get_user_relations(self.context.get('request'))
+        return obj.author_id in relations.following
+
+    def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return obj.author.recipe.count()
\ No newline at end of file
@@ -1,9 +1,12 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, OuterRef, Prefetch, Subquery
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework.response import Response
 from rest_framework import status
 
+from recipes.models import FeedEntry, Recipe
 from .models import Follow
 from rest_framework.decorators import action
 from .serializers import (SetPasswordSerializer, CustomUserCreateSerializer,
@@ -17,6 +20,7 @@ User = get_user_model()
 class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly,]
+    lookup_value_regex = r'\d+'
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -30,9 +34,38 @@ class CustomUserViewSet(UserViewSet):
             self.permission_classes = [IsAuthenticated]
         return super().get_permissions()
 
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None or not recipes_limit.isdigit():
+            return None
+        return int(recipes_limit)
+
+    def get_follow_queryset(self, user):
+        recipes = Recipe.objects.all()
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects
+                .filter(author=OuterRef('author'))
+                .order_by('-pub_date', '-pk')
+                .values('pk')[:recipes_limit]
+            ))
+        return (
+            Follow.objects
+            .filter(user=user)
+            .select_related('author')
+            .annotate(recipes_count=Count('author__recipe'))
+            .prefetch_related(Prefetch(
+                'author__recipe',
+                queryset=recipes,
+                to_attr='limited_recipes',
+            ))
+            .order_by('-id')
+        )
+
     @action(detail=False, permission_classes=[IsAuthenticated,])
     def subscriptions(self, request):
-        queryset = Follow.objects.filter(user=request.user)
+        queryset = self.get_follow_queryset(request.user)
         pages = self.paginate_queryset(queryset)
         serializer = FollowSerializer(
             pages,
@@ -44,18 +77,24 @@ class CustomUserViewSet(UserViewSet):
         methods=['post'], detail=True, permission_classes=[IsAuthenticated])
     def subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, id=id)
+        author_id = int(id)
 
-        if user == author:
+        if user.pk == author_id:
             return Response({
                 'errors': 'Ошибка подписки, нельзя подписываться на себя'
             }, status=status.HTTP_400_BAD_REQUEST)
-        if Follow.objects.filter(user=user, author=author).exists():
+        with transaction.atomic():
+            subscribed = Follow.objects.link(user, [author_id])
+            if subscribed:
+                FeedEntry.objects.follow(user, author_id)
+        if not subscribed:
+            get_object_or_404(User, id=author_id)
             return Response({
                 'errors': 'Ошибка подписки, вы уже подписаны на пользователя'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        follow = Follow.objects.create(user=user, author=author)
+        follow = get_object_or_404(self.get_follow_queryset(user),
+                                   author_id=author_id)
         serializer = FollowSerializer(
             follow, context={'request': request}
         )
@@ -64,15 +103,18 @@ class CustomUserViewSet(UserViewSet):
     @subscribe.mapping.delete
     def del_subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, id=id)
-        if user == author:
+        author_id = int(id)
+        if user.pk == author_id:
             return Response({
                 'errors': 'Ошибка отписки, нельзя отписываться от самого себя'
             }, status=status.HTTP_400_BAD_REQUEST)
-        follow = Follow.objects.filter(user=user, author=author)
-        if not follow.exists():
+        with transaction.atomic():
+            unsubscribed = Follow.objects.unlink(user, [author_id])
+            if unsubscribed:
+                FeedEntry.objects.unfollow(user, author_id)
+        if not unsubscribed:
+            get_object_or_404(User, id=author_id)
             return Response({
                 'errors': 'Ошибка отписки, вы уже отписались'
             }, status=status.HTTP_400_BAD_REQUEST)
-        follow.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)